@@ -0,0 +1,36 @@
+import os
+import json
+import logging
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger('ReadModels.ArrayStore')
+
+META_FILE = "meta.json"
+
+# A directory of .npy files, one per array, plus a meta.json for small scalar values
+# Loading memory maps the arrays read-only, so opening an index costs no reads until it's queried
+def save_arrays(directory: str, arrays: Dict[str, np.ndarray], meta: Optional[Dict] = None) -> None:
+    os.makedirs(directory, exist_ok=True)
+    # Write to temporary files and swap them in, readers never see a partially written array
+    for name, array in arrays.items():
+        path = os.path.join(directory, name + ".npy")
+        with open(path + ".tmp", "wb") as array_file:
+            np.save(array_file, np.ascontiguousarray(array), allow_pickle=False)
+        os.replace(path + ".tmp", path)
+
+    meta_path = os.path.join(directory, META_FILE)
+    with open(meta_path + ".tmp", "w") as meta_file:
+        json.dump({"arrays": sorted(arrays), "meta": meta or {}}, meta_file)
+    os.replace(meta_path + ".tmp", meta_path)
+    logger.debug("Saved %s arrays to %s", len(arrays), directory)
+
+def load_arrays(directory: str, mmap: bool = True) -> Tuple[Dict[str, np.ndarray], Dict]:
+    with open(os.path.join(directory, META_FILE)) as meta_file:
+        contents = json.load(meta_file)
+    mmap_mode = "r" if mmap else None
+    arrays = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode, allow_pickle=False)
+              for name in contents["arrays"]}
+    logger.debug("Loaded %s arrays from %s", len(arrays), directory)
+    return arrays, contents["meta"]
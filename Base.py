@@ -1,4 +1,6 @@
 import os
+import time
+import atexit
 import logging
 import logging.config
 import configparser
@@ -8,6 +10,8 @@ from sqlalchemy.orm import DeclarativeBase, sessionmaker, Mapped, mapped_column
 from sqlalchemy import create_engine, Sequence, URL, event, text, String, Integer, SmallInteger, Table, Column, ForeignKey, select
 from sqlalchemy.dialects import mysql
 
+import CacheStats
+
 WORKING_DIR = os.path.dirname(os.path.realpath(__file__))
 
 config = configparser.ConfigParser()
@@ -22,6 +26,11 @@ db_name=config.get("db", "db_name")
 db_user=config.get("db", "user")
 db_password=config.get("db", "password")
 
+# Write cache statistics at the end of every run if configured
+cache_stats_file=config.get("cache", "stats_file", fallback=None)
+if cache_stats_file:
+    atexit.register(CacheStats.dump, cache_stats_file)
+
 sqlalchemy_url = URL.create(
     "mysql+mysqldb",
     username=db_user,
@@ -134,11 +143,15 @@ class PokeApiResource:
     def get_from_cache(cls, cache_key: int) -> Tuple[Optional["PokeApiResource"], bool]:
         needs_update = False
         if cache_key not in cls._cache:
+            start = time.perf_counter()
             with Session() as session:
                 needs_update = True
                 cache_object = session.scalars(select(cls).filter_by(poke_api_id=cache_key)).first()
                 if cache_object:
                     cls._cache[cache_object.poke_api_id] = cache_object
+            CacheStats.record_miss(cls.__name__, time.perf_counter() - start, cache_object is not None)
+        else:
+            CacheStats.record_hit(cls.__name__)
         return cls._cache.get(cache_key), needs_update
     
     def recache(self):
@@ -0,0 +1,122 @@
+import logging
+from collections import namedtuple
+from itertools import combinations
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from ReadModels import load_all
+from Berries import Berry, BerryFlavor, BerryFlavorLink
+
+logger = logging.getLogger('ReadModels.BerrySpace')
+
+# Columns after the flavor potencies in features
+TRAIT_FIELDS = ("smoothness", "size", "growth_time", "natural_gift_power")
+
+BerryMatch = namedtuple("BerryMatch", ["berry_id", "score"])
+Blend = namedtuple("Blend", ["berry_ids", "flavors", "smoothness", "score"])
+
+def _cosine(rows: np.ndarray, target: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(rows, axis=-1) * np.linalg.norm(target)
+    return np.divide(rows @ target, norms, out=np.zeros(rows.shape[:-1], dtype=np.float32), where=norms > 0)
+
+# Berry feature matrix, rows follow berry_ids and flavor columns follow flavor_ids (poke_api_ids, spicy to sour)
+#   potencies[berry, flavor]
+#   features[berry] = potencies then TRAIT_FIELDS
+class BerrySpace:
+    def __init__(self, berry_ids: np.ndarray, flavor_ids: np.ndarray, flavor_names: List[str], features: np.ndarray):
+        self.berry_ids = berry_ids
+        self.flavor_ids = flavor_ids
+        self.flavor_names = flavor_names
+        self.features = features
+        self.potencies = features[:, :len(flavor_ids)]
+        self.traits = features[:, len(flavor_ids):]
+        self._berry_idx: Dict[int, int] = {int(berry_id): idx for idx, berry_id in enumerate(berry_ids)}
+        # Blend candidates are built on first use, per size
+        self._combos: Dict[int, np.ndarray] = {}
+
+    @classmethod
+    def load(cls) -> "BerrySpace":
+        flavors = sorted(load_all(BerryFlavor), key=lambda row: row.poke_api_id)
+        flavor_idx = {row.id: idx for idx, row in enumerate(flavors)}
+        berries = sorted(load_all(Berry), key=lambda row: row.poke_api_id)
+        berry_idx = {row.id: idx for idx, row in enumerate(berries)}
+
+        features = np.zeros((len(berries), len(flavors) + len(TRAIT_FIELDS)), dtype=np.float32)
+        for link in load_all(BerryFlavorLink):
+            if link.berry_key in berry_idx and link.flavor_key in flavor_idx:
+                features[berry_idx[link.berry_key], flavor_idx[link.flavor_key]] = link.potency
+        for idx, row in enumerate(berries):
+            features[idx, len(flavors):] = [getattr(row, field) or 0 for field in TRAIT_FIELDS]
+
+        logger.debug("Loaded BerrySpace with %s berries and %s flavors", len(berries), len(flavors))
+        return cls(np.array([row.poke_api_id for row in berries], dtype=np.int32),
+                   np.array([row.poke_api_id for row in flavors], dtype=np.int32),
+                   [row.name for row in flavors], features)
+
+    def profile(self, berry_id: int) -> np.ndarray:
+        return self.potencies[self._berry_idx[berry_id]]
+
+    def similarity(self, flavor_profile: Sequence[float]) -> np.ndarray:
+        # Cosine similarity of every berry's potencies to the profile
+        return _cosine(self.potencies, np.asarray(flavor_profile, dtype=np.float32))
+
+    def nearest(self, flavor_profile: Sequence[float], k: int = 5, metric: str = "cosine",
+                exclude_ids: Sequence[int] = ()) -> List[BerryMatch]:
+        # Berries closest to a flavor profile, best first
+        # cosine compares flavor balance, euclidean also potency strength (score is the negated distance)
+        target = np.asarray(flavor_profile, dtype=np.float32)
+        if metric == "cosine":
+            scores = self.similarity(target)
+        elif metric == "euclidean":
+            scores = -np.linalg.norm(self.potencies - target, axis=1)
+        else:
+            raise ValueError("Unknown metric: " + metric)
+        if exclude_ids:
+            scores = np.where(np.isin(self.berry_ids, exclude_ids), -np.inf, scores)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k else np.zeros(0, dtype=np.intp)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [BerryMatch(int(self.berry_ids[idx]), float(scores[idx])) for idx in top if np.isfinite(scores[idx])]
+
+    def nearest_to_berry(self, berry_id: int, k: int = 5, metric: str = "cosine") -> List[BerryMatch]:
+        return self.nearest(self.profile(berry_id), k, metric, exclude_ids=[berry_id])
+
+    def _candidate_combos(self, size: int) -> np.ndarray:
+        combos = self._combos.get(size)
+        if combos is None:
+            combos = np.array(list(combinations(range(len(self.berry_ids)), size)), dtype=np.int16).reshape(-1, size)
+            self._combos[size] = combos
+        return combos
+
+    def blend_flavors(self, combos: np.ndarray) -> np.ndarray:
+        # Pokeblock style blend of each row of berry positions:
+        # flavor totals, each weakened by the next flavor in spicy, dry, sweet, bitter, sour order,
+        # then every negative flavor is dropped and lowers the positive ones by one
+        totals = self.potencies[combos].sum(axis=1)
+        weakened = totals - np.roll(totals, -1, axis=1)
+        negatives = (weakened < 0).sum(axis=1, keepdims=True)
+        return np.where(weakened > 0, np.maximum(weakened - negatives, 0), 0)
+
+    def best_blends(self, target: Sequence[float], sizes: Sequence[int] = (2, 3), n: int = 10,
+                    berry_ids: Optional[Sequence[int]] = None) -> List[Blend]:
+        # Blends of distinct berries closest to the target flavors (euclidean), over every pair and/or triple
+        target = np.asarray(target, dtype=np.float32)
+        allowed = None if berry_ids is None else np.isin(self.berry_ids, berry_ids)
+        results = []
+        for size in sizes:
+            combos = self._candidate_combos(size)
+            if allowed is not None:
+                combos = combos[allowed[combos].all(axis=1)]
+            if not len(combos):
+                continue
+            flavors = self.blend_flavors(combos)
+            scores = -np.linalg.norm(flavors - target, axis=1)
+            k = min(n, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            smoothness = self.traits[combos[top], TRAIT_FIELDS.index("smoothness")].mean(axis=1) - size
+            for pos, idx in enumerate(top.tolist()):
+                results.append(Blend(tuple(int(berry_id) for berry_id in self.berry_ids[combos[idx]]),
+                                     flavors[idx], float(smoothness[pos]), float(scores[idx])))
+        results.sort(key=lambda blend: (-blend.score, blend.smoothness))
+        return results[:n]
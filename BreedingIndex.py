@@ -0,0 +1,158 @@
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ReadModels import load_all
+from Moves import MoveLearnMethod
+from Pokemon import Pokemon, PokemonSpecies, EggGroup
+from LearnsetIndex import LearnsetIndex, make_key, split_keys, METHOD_BITS
+
+logger = logging.getLogger('ReadModels.BreedingIndex')
+
+# Species flags
+DITTO = 1
+UNDISCOVERED = 2
+GENDERLESS = 4
+MALE_ONLY = 8
+FEMALE_ONLY = 16
+
+DITTO_GROUP = "ditto"
+UNDISCOVERED_GROUP = "no-eggs"
+EGG_METHOD = "egg"
+
+# Breeding compatibility of every species, ids are poke_api_ids
+# egg_masks[i] has a bit per egg group of species_ids[i], flags[i] the flags above
+# pokemon_species maps Pokemon to their species, egg_method_id is the "egg" MoveLearnMethod
+class BreedingIndex:
+    def __init__(self, species_ids: np.ndarray, egg_masks: np.ndarray, flags: np.ndarray,
+                 pokemon_species: Dict[int, int], egg_method_id: Optional[int]):
+        self.species_ids = species_ids
+        self.egg_masks = egg_masks
+        self.flags = flags
+        self.pokemon_species = pokemon_species
+        self.egg_method_id = egg_method_id
+        self._species_idx: Dict[int, int] = {int(species_id): idx for idx, species_id in enumerate(species_ids)}
+
+    @classmethod
+    def load(cls) -> "BreedingIndex":
+        egg_groups = sorted(load_all(EggGroup), key=lambda row: row.poke_api_id)
+        group_bits = {row.id: 1 << idx for idx, row in enumerate(egg_groups)}
+        group_flags = {row.id: {DITTO_GROUP: DITTO, UNDISCOVERED_GROUP: UNDISCOVERED}.get(row.name, 0) for row in egg_groups}
+
+        species = sorted(load_all(PokemonSpecies), key=lambda row: row.poke_api_id)
+        egg_masks = np.zeros(len(species), dtype=np.uint32)
+        flags = np.zeros(len(species), dtype=np.uint8)
+        for idx, row in enumerate(species):
+            for key in (row.egg_group_1_key, row.egg_group_2_key):
+                egg_masks[idx] |= group_bits.get(key, 0)
+                flags[idx] |= group_flags.get(key, 0)
+            # gender_rate is the chance of being female in eighths, -1 when genderless
+            if row.gender_rate == -1:
+                flags[idx] |= GENDERLESS
+            elif row.gender_rate == 0:
+                flags[idx] |= MALE_ONLY
+            elif row.gender_rate == 8:
+                flags[idx] |= FEMALE_ONLY
+
+        species_keys = {row.id: row.poke_api_id for row in species}
+        pokemon_species = {row.poke_api_id: species_keys[row.species_key] for row in load_all(Pokemon) if row.species_key in species_keys}
+        egg_method_id = next((row.poke_api_id for row in load_all(MoveLearnMethod) if row.name == EGG_METHOD), None)
+        logger.debug("Loaded BreedingIndex with %s species and %s egg groups", len(species), len(egg_groups))
+        return cls(np.array([row.poke_api_id for row in species], dtype=np.int32), egg_masks, flags, pokemon_species, egg_method_id)
+
+    def _compatible(self, idx: int) -> np.ndarray:
+        # Mask over all species able to produce an egg with species idx
+        flags = self.flags
+        own = int(flags[idx])
+        if own & UNDISCOVERED:
+            return np.zeros(len(flags), dtype=bool)
+        breedable = (flags & (UNDISCOVERED | DITTO)) == 0
+        ditto = (flags & DITTO) != 0
+        if own & DITTO:
+            return breedable
+        # Genderless species only breed with Ditto
+        if own & GENDERLESS:
+            return ditto
+        mask = breedable & ((self.egg_masks & self.egg_masks[idx]) != 0) & ((flags & GENDERLESS) == 0)
+        # Single gender species need a partner of the other gender
+        if own & MALE_ONLY:
+            mask &= (flags & MALE_ONLY) == 0
+        if own & FEMALE_ONLY:
+            mask &= (flags & FEMALE_ONLY) == 0
+        return mask | ditto
+
+    def can_breed(self, species_id_1: int, species_id_2: int) -> bool:
+        # Same rules as _compatible() for a single pair
+        idx_1 = self._species_idx[species_id_1]
+        idx_2 = self._species_idx[species_id_2]
+        flags_1 = int(self.flags[idx_1])
+        flags_2 = int(self.flags[idx_2])
+        if (flags_1 | flags_2) & UNDISCOVERED:
+            return False
+        if flags_1 & DITTO or flags_2 & DITTO:
+            return not (flags_1 & DITTO and flags_2 & DITTO)
+        if (flags_1 | flags_2) & GENDERLESS:
+            return False
+        if flags_1 & flags_2 & (MALE_ONLY | FEMALE_ONLY):
+            return False
+        return bool(self.egg_masks[idx_1] & self.egg_masks[idx_2])
+
+    def partners(self, species_id: int) -> np.ndarray:
+        # poke_api_ids of every compatible species
+        return self.species_ids[self._compatible(self._species_idx[species_id])]
+
+    def _species_mask(self, learnsets: LearnsetIndex, bits: np.ndarray) -> np.ndarray:
+        # Species of the Pokemon set in a LearnsetIndex bitset
+        mask = np.zeros(len(self.species_ids), dtype=bool)
+        for pokemon_id in learnsets.to_pokemon_ids(bits).tolist():
+            idx = self._species_idx.get(self.pokemon_species.get(pokemon_id))
+            if idx is not None:
+                mask[idx] = True
+        return mask
+
+    def egg_move_chain(self, learnsets: LearnsetIndex, move_id: int, species_id: int,
+                       version_group_id: Optional[int] = None) -> Optional[List[int]]:
+        # Shortest breeding chain passing the move to species_id as an egg move, as species ids from a species
+        # learning it another way to species_id, None when there is none
+        # Each step breeds a father knowing the move with a mother of the next species, which learns it as an egg move
+        if species_id not in self._species_idx:
+            return None
+        # Learnset keys of the move, in one version group or all of them
+        if version_group_id is None:
+            low, high = make_key(move_id, 0, 0), make_key(move_id + 1, 0, 0)
+        else:
+            low = make_key(move_id, version_group_id, 0)
+            high = low + (1 << METHOD_BITS)
+        rows = np.arange(np.searchsorted(learnsets.keys, low), np.searchsorted(learnsets.keys, high))
+        is_egg = split_keys(learnsets.keys[rows])[2] == self.egg_method_id
+        bits = learnsets.pokemon_bits
+        knows = self._species_mask(learnsets, np.bitwise_or.reduce(bits[rows[~is_egg]], axis=0, initial=0))
+        egg_learners = self._species_mask(learnsets, np.bitwise_or.reduce(bits[rows[is_egg]], axis=0, initial=0))
+
+        target = self._species_idx[species_id]
+        if knows[target]:
+            return [species_id]
+        if not egg_learners[target]:
+            return None
+
+        # Fathers must have males, offspring take the mother's species so she must have females
+        can_father = (self.flags & (FEMALE_ONLY | GENDERLESS | UNDISCOVERED | DITTO)) == 0
+        can_mother = egg_learners & ((self.flags & (MALE_ONLY | GENDERLESS | UNDISCOVERED | DITTO)) == 0)
+        parent = np.full(len(self.species_ids), -1, dtype=np.intp)
+        visited = knows & can_father
+        frontier = np.flatnonzero(visited)
+        while len(frontier):
+            next_frontier = []
+            for idx in frontier.tolist():
+                reached = np.flatnonzero(self._compatible(idx) & can_mother & ~visited)
+                visited[reached] = True
+                parent[reached] = idx
+                if visited[target]:
+                    chain = [target]
+                    while parent[chain[-1]] != -1:
+                        chain.append(parent[chain[-1]])
+                    return [int(self.species_ids[idx]) for idx in reversed(chain)]
+                next_frontier.append(reached[can_father[reached]])
+            frontier = np.concatenate(next_frontier) if next_frontier else np.zeros(0, dtype=np.intp)
+        return None
@@ -0,0 +1,96 @@
+import sys
+import json
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger('DB')
+
+# Counters for the class level _cache dicts of PokeApiResource types
+# Keyed by class name, updated from PokeApiResource.get_from_cache
+# Every miss falls back to a database lookup, db_fallback_hits counts the ones that found the row
+class CacheCounter:
+    __slots__ = ("hits", "misses", "db_fallback_hits", "db_fallback_time")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.db_fallback_hits = 0
+        self.db_fallback_time = 0.0
+
+_counters: Dict[str, CacheCounter] = {}
+# The crawler and its prefetch threads record concurrently, += on a counter is not atomic
+_lock = threading.Lock()
+
+def _counter(type_name: str) -> CacheCounter:
+    # Called with _lock held
+    counter = _counters.get(type_name)
+    if counter is None:
+        counter = _counters[type_name] = CacheCounter()
+    return counter
+
+def record_hit(type_name: str) -> None:
+    with _lock:
+        _counter(type_name).hits += 1
+
+def record_miss(type_name: str, db_time: float, found_in_db: bool) -> None:
+    with _lock:
+        counter = _counter(type_name)
+        counter.misses += 1
+        counter.db_fallback_time += db_time
+        if found_in_db:
+            counter.db_fallback_hits += 1
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+
+def approximate_size(obj) -> int:
+    # Shallow size of the object plus its attribute values
+    # SQLAlchemy instance state and related objects are not followed, they are shared between entries
+    size = sys.getsizeof(obj)
+    attrs = getattr(obj, "__dict__", None)
+    if attrs is not None:
+        size += sys.getsizeof(attrs)
+        for key, value in attrs.items():
+            if key.startswith("_sa_") or hasattr(value, "__table__") or isinstance(value, list):
+                continue
+            size += sys.getsizeof(value)
+    return size
+
+def _cached_types():
+    from Base import PokeApiResource
+    pending = list(PokeApiResource.__subclasses__())
+    while pending:
+        T = pending.pop()
+        pending.extend(T.__subclasses__())
+        if "_cache" in T.__dict__:
+            yield T
+
+def cache_stats() -> Dict[str, Dict]:
+    stats = {}
+    for T in sorted(_cached_types(), key=lambda T: T.__name__):
+        with _lock:
+            counter = _counters.get(T.__name__, CacheCounter())
+            hits, misses, db_fallback_hits, db_fallback_time = counter.hits, counter.misses, counter.db_fallback_hits, counter.db_fallback_time
+        cache = T._cache
+        lookups = hits + misses
+        stats[T.__name__] = {
+            "entries": len(cache),
+            "approx_bytes": sys.getsizeof(cache) + sum(approximate_size(obj) for obj in list(cache.values())),
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / lookups if lookups else None,
+            "db_fallback_hits": db_fallback_hits,
+            "db_fallback_seconds": round(db_fallback_time, 6),
+        }
+    return stats
+
+def to_json(indent: Optional[int] = 2) -> str:
+    return json.dumps({"generated_at": time.time(), "types": cache_stats()}, indent=indent)
+
+def dump(path: str) -> None:
+    with open(path, "w") as stats_file:
+        stats_file.write(to_json())
+    logger.info("Wrote cache statistics to %s", path)
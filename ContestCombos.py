@@ -0,0 +1,124 @@
+import logging
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+
+from Base import ContestComboLink, SuperContestComboLink, engine
+from ReadModels import load_all
+from Contests import ContestEffect, SuperContestEffect
+from Moves import Move
+from LearnsetIndex import LearnsetIndex
+
+logger = logging.getLogger('ReadModels.ContestCombos')
+
+# Appeal of a follow-up move used right after its lead move
+COMBO_MULTIPLIER = 2.0
+# Pokemon solved together by solve_bulk, bounds the [pokemon, move, move] working arrays
+BULK_CHUNK = 64
+
+ComboPlan = namedtuple("ComboPlan", ["appeal", "move_ids"])
+
+# Contest combo graph over moves, positions follow move_ids (poke_api_ids)
+#   appeal[kind, move]: appeal of the move's contest (kind 0) or super contest (kind 1) effect
+#   combos[kind][lead, follow_up]: True when using follow_up right after lead is a combo
+# Contests penalise using the same move on two turns in a row, but not using it again later, so plans
+# only rule out consecutive repeats unless allow_consecutive_repeats is set
+class ContestCombos:
+    CONTEST = 0
+    SUPER_CONTEST = 1
+
+    def __init__(self, move_ids: np.ndarray, appeal: np.ndarray, combos: np.ndarray):
+        self.move_ids = move_ids
+        self.appeal = appeal
+        self.combos = combos
+        self._move_pos: Dict[int, int] = {int(move_id): pos for pos, move_id in enumerate(move_ids)}
+
+    @classmethod
+    def load(cls) -> "ContestCombos":
+        moves = sorted(load_all(Move), key=lambda row: row.poke_api_id)
+        move_pos = {row.id: pos for pos, row in enumerate(moves)}
+        contest_effects = {row.id: row for row in load_all(ContestEffect)}
+        super_contest_effects = {row.id: row for row in load_all(SuperContestEffect)}
+
+        appeal = np.zeros((2, len(moves)), dtype=np.float32)
+        for pos, row in enumerate(moves):
+            effect = contest_effects.get(row.contest_effect_key)
+            if effect is not None:
+                appeal[cls.CONTEST, pos] = effect.appeal or 0
+            super_effect = super_contest_effects.get(row.super_contest_effect_key)
+            if super_effect is not None:
+                appeal[cls.SUPER_CONTEST, pos] = super_effect.appeal or 0
+
+        combos = np.zeros((2, len(moves), len(moves)), dtype=bool)
+        with engine.connect() as conn:
+            for kind, table in ((cls.CONTEST, ContestComboLink), (cls.SUPER_CONTEST, SuperContestComboLink)):
+                for lead_key, follow_up_key in conn.execute(select(table.c.lead_move_key, table.c.follow_up_move_key)):
+                    if lead_key in move_pos and follow_up_key in move_pos:
+                        combos[kind, move_pos[lead_key], move_pos[follow_up_key]] = True
+
+        logger.debug("Loaded ContestCombos: %s moves, %s combos", len(moves), int(combos.sum()))
+        return cls(np.array([row.poke_api_id for row in moves], dtype=np.int32), appeal, combos)
+
+    def _gains(self, positions: np.ndarray, valid: np.ndarray, kind: int, allow_consecutive_repeats: bool) -> np.ndarray:
+        # gains[..., lead, follow_up] appeal earned by follow_up after lead, -inf where not allowed
+        appeal = self.appeal[kind][positions]
+        combo = self.combos[kind][positions[..., :, None], positions[..., None, :]]
+        gains = appeal[..., None, :] * np.where(combo, COMBO_MULTIPLIER, 1.0)
+        allowed = valid[..., :, None] & valid[..., None, :]
+        if not allow_consecutive_repeats:
+            allowed &= ~np.eye(positions.shape[-1], dtype=bool)
+        return np.where(allowed, gains, -np.inf).astype(np.float32)
+
+    def _solve(self, positions: np.ndarray, valid: np.ndarray, turns: int, kind: int, allow_consecutive_repeats: bool) -> List[ComboPlan]:
+        # Dynamic programme over [pokemon, move] best totals ending with each move, one step per turn
+        gains = self._gains(positions, valid, kind, allow_consecutive_repeats)
+        best = np.where(valid, self.appeal[kind][positions], -np.inf).astype(np.float32)
+        choices = []
+        for _ in range(1, turns):
+            totals = best[:, :, None] + gains
+            choice = np.argmax(totals, axis=1)
+            best = np.take_along_axis(totals, choice[:, None, :], axis=1)[:, 0, :]
+            choices.append(choice)
+
+        plans = []
+        last = np.argmax(best, axis=1)
+        for row in range(len(positions)):
+            if not np.isfinite(best[row, last[row]]):
+                plans.append(ComboPlan(0.0, []))
+                continue
+            sequence = [int(last[row])]
+            for choice in reversed(choices):
+                sequence.append(int(choice[row, sequence[-1]]))
+            sequence.reverse()
+            plans.append(ComboPlan(float(best[row, last[row]]), [int(self.move_ids[positions[row, pos]]) for pos in sequence]))
+        return plans
+
+    def solve(self, move_ids: Sequence[int], turns: int = 5, kind: int = CONTEST, allow_consecutive_repeats: bool = False) -> ComboPlan:
+        # Highest total appeal over the turns using only the given moves
+        positions = np.array([[self._move_pos[move_id] for move_id in move_ids if move_id in self._move_pos]], dtype=np.intp)
+        if positions.shape[1] == 0:
+            return ComboPlan(0.0, [])
+        return self._solve(positions, np.ones(positions.shape, dtype=bool), turns, kind, allow_consecutive_repeats)[0]
+
+    def solve_bulk(self, learnsets: LearnsetIndex, pokemon_ids: Sequence[int], version_group_id: int, turns: int = 5,
+                   kind: int = CONTEST, allow_consecutive_repeats: bool = False,
+                   method_ids: Optional[Sequence[int]] = None) -> Dict[int, ComboPlan]:
+        # solve() for the learnset of every Pokemon in the version group, in padded chunks
+        plans: Dict[int, ComboPlan] = {}
+        for start in range(0, len(pokemon_ids), BULK_CHUNK):
+            chunk = list(pokemon_ids[start:start + BULK_CHUNK])
+            learnable = [[self._move_pos[int(move_id)] for move_id in learnsets.moves_in(pokemon_id, version_group_id, method_ids)
+                          if int(move_id) in self._move_pos] for pokemon_id in chunk]
+            width = max((len(positions) for positions in learnable), default=0)
+            if width == 0:
+                plans.update({pokemon_id: ComboPlan(0.0, []) for pokemon_id in chunk})
+                continue
+            positions = np.zeros((len(chunk), width), dtype=np.intp)
+            valid = np.zeros((len(chunk), width), dtype=bool)
+            for row, row_positions in enumerate(learnable):
+                positions[row, :len(row_positions)] = row_positions
+                valid[row, :len(row_positions)] = True
+            plans.update(zip(chunk, self._solve(positions, valid, turns, kind, allow_consecutive_repeats)))
+        return plans
@@ -0,0 +1,162 @@
+import logging
+from collections import namedtuple
+from typing import Optional, Union
+
+import numpy as np
+
+from ReadModels import load_all
+from Moves import Move, DamageClass
+from Pokemon import PokemonNature, PokemonStat, PokemonType
+from StatStore import StatStore
+from TypeMatrix import TypeMatrix
+
+logger = logging.getLogger('ReadModels.DamageEngine')
+
+ArrayLike = Union[int, np.ndarray]
+
+# Stats a nature can change, in NATURE_STATS column order
+NATURE_STATS = ("attack", "defense", "special-attack", "special-defense", "speed")
+PHYSICAL, SPECIAL, STATUS = 0, 1, 2
+
+MOVE_DTYPE = np.dtype([
+    ("move_id", np.int32), ("type_idx", np.int16), ("damage_class", np.int8), ("power", np.int16),
+    ("accuracy", np.int16), ("crit_rate", np.int8), ("min_hits", np.int8), ("max_hits", np.int8),
+])
+
+# Damage of one use of the move, every hit included
+DamageRange = namedtuple("DamageRange", ["min_damage", "max_damage", "multiplier"])
+
+# Batch damage calculator over precompiled stat, move, nature and type arrays
+# Every argument of damage() may be a scalar or an array, they are broadcast against each other
+# Ids are poke_api_ids, the formula is the one used from generation 5 on
+class DamageEngine:
+    def __init__(self, stats: StatStore, types: TypeMatrix, moves: np.ndarray, nature_ids: np.ndarray, nature_multipliers: np.ndarray):
+        self.stats = stats
+        self.types = types
+        self.moves = moves
+        self.nature_ids = nature_ids
+        # nature_multipliers[nature, NATURE_STATS column]
+        self.nature_multipliers = nature_multipliers
+
+        # base[pokemon, stat] in TypeMatrix.pokemon_ids order, hp then NATURE_STATS
+        rows = stats.rows
+        if not np.array_equal(rows["pokemon_id"], types.pokemon_ids):
+            raise ValueError("StatStore and TypeMatrix were loaded from different Pokemon")
+        self.base = np.stack([rows[field] for field in ("hp", "attack", "defense", "special_attack", "special_defense", "speed")], axis=1).astype(np.int32)
+
+    @classmethod
+    def load(cls, stats: Optional[StatStore] = None, types: Optional[TypeMatrix] = None) -> "DamageEngine":
+        stats = stats or StatStore.load()
+        types = types or TypeMatrix.load()
+        type_idx = {row.id: types.type_index(row.poke_api_id) for row in load_all(PokemonType) if types.has_type(row.poke_api_id)}
+        damage_classes = {row.id: {"physical": PHYSICAL, "special": SPECIAL}.get(row.name, STATUS) for row in load_all(DamageClass)}
+
+        moves = sorted(load_all(Move), key=lambda row: row.poke_api_id)
+        move_rows = np.zeros(len(moves), dtype=MOVE_DTYPE)
+        for idx, row in enumerate(moves):
+            move_type = type_idx.get(row.move_type_key)
+            move_rows[idx] = (
+                row.poke_api_id,
+                types.none_idx if move_type is None else move_type,
+                damage_classes.get(row.damage_class_key, STATUS),
+                row.power or 0,
+                row.accuracy or 0,
+                row.crit_rate or 0,
+                row.min_hits or 1,
+                row.max_hits or 1,
+            )
+
+        stat_names = {row.id: row.name for row in load_all(PokemonStat)}
+        natures = sorted(load_all(PokemonNature), key=lambda row: row.poke_api_id)
+        nature_multipliers = np.ones((len(natures), len(NATURE_STATS)), dtype=np.float32)
+        for idx, row in enumerate(natures):
+            # Neutral natures raise and lower the same stat
+            if row.increased_stat_key == row.decreased_stat_key:
+                continue
+            for key, multiplier in ((row.increased_stat_key, 1.1), (row.decreased_stat_key, 0.9)):
+                name = stat_names.get(key)
+                if name in NATURE_STATS:
+                    nature_multipliers[idx, NATURE_STATS.index(name)] = multiplier
+
+        logger.debug("Loaded DamageEngine with %s moves and %s natures", len(move_rows), len(natures))
+        return cls(stats, types, move_rows, np.array([row.poke_api_id for row in natures], dtype=np.int32), nature_multipliers)
+
+    @staticmethod
+    def _lookup(ids: np.ndarray, values: ArrayLike, kind: str) -> np.ndarray:
+        values = np.asarray(values)
+        idx = np.minimum(np.searchsorted(ids, values), max(len(ids) - 1, 0))
+        if len(ids) == 0 or np.any(ids[idx] != values):
+            raise KeyError("Unknown " + kind + " id in " + str(values))
+        return idx
+
+    def stat(self, pokemon_idx: np.ndarray, column: int, level: ArrayLike, nature_idx: Optional[np.ndarray],
+             iv: ArrayLike, ev: ArrayLike) -> np.ndarray:
+        # Battle stat, column indexes base (1-5, hp is not used in damage)
+        value = (2 * self.base[pokemon_idx, column] + iv + np.asarray(ev) // 4) * level // 100 + 5
+        if nature_idx is not None:
+            value = np.floor(value * self.nature_multipliers[nature_idx, column - 1]).astype(np.int32)
+        return value
+
+    def damage(self, attacker_id: ArrayLike, defender_id: ArrayLike, move_id: ArrayLike, level: ArrayLike = 50,
+               defender_level: Optional[ArrayLike] = None, attacker_nature_id: Optional[ArrayLike] = None,
+               defender_nature_id: Optional[ArrayLike] = None, iv: ArrayLike = 31, ev: ArrayLike = 0,
+               critical: ArrayLike = False, generation_id: Optional[int] = None) -> DamageRange:
+        attacker = self._lookup(self.types.pokemon_ids, attacker_id, "pokemon")
+        defender = self._lookup(self.types.pokemon_ids, defender_id, "pokemon")
+        move = self.moves[self._lookup(self.moves["move_id"], move_id, "move")]
+        level = np.asarray(level, dtype=np.int32)
+        defender_level = level if defender_level is None else np.asarray(defender_level, dtype=np.int32)
+        attacker_nature = None if attacker_nature_id is None else self._lookup(self.nature_ids, attacker_nature_id, "nature")
+        defender_nature = None if defender_nature_id is None else self._lookup(self.nature_ids, defender_nature_id, "nature")
+
+        # Physical moves use attack against defense, special moves their special counterparts
+        special = move["damage_class"] == SPECIAL
+        attack = np.where(special,
+                          self.stat(attacker, 3, level, attacker_nature, iv, ev),
+                          self.stat(attacker, 1, level, attacker_nature, iv, ev))
+        defense = np.where(special,
+                           self.stat(defender, 4, defender_level, defender_nature, iv, ev),
+                           self.stat(defender, 2, defender_level, defender_nature, iv, ev))
+
+        base = (2 * level // 5 + 2) * move["power"].astype(np.int32) * attack // np.maximum(defense, 1) // 50 + 2
+        gen = self.types.generation_index(generation_id)
+        # Critical hits do 1.5x from generation 6 on, 2x before
+        if self.types.generation_ids[gen] >= 6:
+            base = np.where(critical, base * 3 // 2, base)
+        else:
+            base = np.where(critical, base * 2, base)
+
+        attacker_types = self.types.pokemon_types[gen, attacker]
+        defender_types = self.types.pokemon_types[gen, defender]
+        move_type = move["type_idx"]
+        matrix = self.types.multipliers[gen]
+        # Typeless moves (no known type) hit everything for 1.0 and get no STAB,
+        # a single typed attacker's second type is none_idx as well
+        typed = move_type != self.types.none_idx
+        stab = typed & ((attacker_types[..., 0] == move_type) | (attacker_types[..., 1] == move_type))
+        att = np.where(typed, move_type, 0)
+        multiplier = np.where(typed, matrix[att, defender_types[..., 0]] * matrix[att, defender_types[..., 1]], 1.0).astype(np.float32)
+
+        # Random factor 85-100%, then STAB, then type effectiveness, each rounded down
+        min_damage = base * 85 // 100
+        max_damage = base
+        min_damage = np.where(stab, min_damage * 3 // 2, min_damage)
+        max_damage = np.where(stab, max_damage * 3 // 2, max_damage)
+        min_damage = np.floor(min_damage * multiplier).astype(np.int32)
+        max_damage = np.floor(max_damage * multiplier).astype(np.int32)
+
+        # A hit that isn't immune does at least 1
+        hits = (multiplier > 0) & (move["damage_class"] != STATUS) & (move["power"] > 0)
+        min_damage = np.where(hits, np.maximum(min_damage, 1) * move["min_hits"], 0)
+        max_damage = np.where(hits, np.maximum(max_damage, 1) * move["max_hits"], 0)
+        return DamageRange(min_damage, max_damage, multiplier)
+
+    def hit_chance(self, move_id: ArrayLike) -> np.ndarray:
+        # Accuracy as a probability, moves without accuracy never miss
+        accuracy = self.moves["accuracy"][self._lookup(self.moves["move_id"], move_id, "move")]
+        return np.where(accuracy > 0, accuracy / 100.0, 1.0)
+
+    def crit_chance(self, move_id: ArrayLike) -> np.ndarray:
+        # Generation 7+ critical hit stages: 1/24, 1/8, 1/2, always
+        stage = self.moves["crit_rate"][self._lookup(self.moves["move_id"], move_id, "move")]
+        return np.array([1 / 24, 1 / 8, 1 / 2, 1.0], dtype=np.float32)[np.clip(stage, 0, 3)]
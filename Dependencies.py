@@ -0,0 +1,81 @@
+import logging
+from typing import Dict, Iterator, List, Tuple, Type
+
+from Base import PokeApiResource
+from Evolution import EvolutionChain
+from Games import Generation, VersionGroup, Version
+from Items import Item
+from Locations import Region, Location, LocationArea
+from Moves import Move, Machine
+from Pokemon import Pokemon, PokemonSpecies, PokemonForm
+
+logger = logging.getLogger('PokeBase')
+
+# Static description of which payload paths of each resource reference which other resources
+# Paths are attribute names separated by ".", a "[]" suffix iterates a list
+# Every path ends at a resource reference, only its id_ is read so no extra requests are made while walking
+# Prefetches share the API rate limit with the crawler, so only the latency-bound chains are listed:
+# references the process_* method always follows right away and whose payload leads to the next one,
+# e.g. Pokemon -> PokemonSpecies -> EvolutionChain -> PokemonSpecies -> Pokemon.
+# Wide fan-outs (a Pokemon's moves, encounters, version details, text entry languages) are left to the crawler.
+DEPENDENCY_MANIFEST: Dict[Type[PokeApiResource], List[Tuple[str, Type[PokeApiResource]]]] = {
+    # Evolution families
+    Pokemon: [
+        ("species", PokemonSpecies),
+    ],
+    PokemonForm: [
+        ("pokemon", Pokemon),
+    ],
+    PokemonSpecies: [
+        ("evolves_from_species", PokemonSpecies),
+        ("evolution_chain", EvolutionChain),
+        ("varieties[].pokemon", Pokemon),
+    ],
+    EvolutionChain: [
+        ("chain.species", PokemonSpecies),
+        ("chain.evolves_to[].species", PokemonSpecies),
+        ("chain.evolves_to[].evolves_to[].species", PokemonSpecies),
+    ],
+
+    # Parent chains
+    Machine: [
+        ("item", Item),
+        ("move", Move),
+    ],
+    LocationArea: [
+        ("location", Location),
+    ],
+    Location: [
+        ("region", Region),
+    ],
+    Version: [
+        ("version_group", VersionGroup),
+    ],
+    VersionGroup: [
+        ("generation", Generation),
+    ],
+}
+
+def _walk(data, attrs: List[str]) -> Iterator:
+    if data is None:
+        return
+    if not attrs:
+        yield data
+        return
+    attr = attrs[0]
+    if attr.endswith("[]"):
+        for item in getattr(data, attr[:-2], None) or []:
+            yield from _walk(item, attrs[1:])
+    else:
+        yield from _walk(getattr(data, attr, None), attrs[1:])
+
+def iter_dependencies(T: Type[PokeApiResource], data) -> Iterator[Tuple[Type[PokeApiResource], int]]:
+    # Yields each (type, id_) referenced by data once
+    seen = set()
+    for path, D in DEPENDENCY_MANIFEST.get(T, []):
+        for ref in _walk(data, path.split(".")):
+            id_ = getattr(ref, "id_", None)
+            if id_ is None or (D, id_) in seen:
+                continue
+            seen.add((D, id_))
+            yield D, id_
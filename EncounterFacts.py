@@ -0,0 +1,198 @@
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import Integer, String, UniqueConstraint, Index, select, delete, insert, or_
+
+from Base import Base, Session, TinyInteger, EncounterToEncounterCondValLink, get_ids
+from Encounters import Encounter, EncounterMethod, EncounterConditionValue
+from Games import Version
+from Locations import PokemonEncounter, LocationArea, Location, Region
+from Pokemon import Pokemon
+from ReadModels import load_all
+from IndexRegistry import IndexRegistry
+
+logger = logging.getLogger('DB')
+
+_refresh_lock = threading.Lock()
+
+# One row per pokemon/version/area/method/condition set, ids are poke_api_ids
+# pokemon_key and location_area_key are kept so a refresh can replace the rows of one Pokemon or area
+class EncounterFact(Base):
+    __tablename__ = "EncounterFact"
+    id: Mapped[int] = mapped_column(Integer,primary_key=True)
+    pokemon_key: Mapped[int] = mapped_column(Integer)
+    location_area_key: Mapped[int] = mapped_column(Integer)
+    pokemon_id: Mapped[int] = mapped_column(Integer)
+    version_id: Mapped[int] = mapped_column(Integer)
+    location_area_id: Mapped[int] = mapped_column(Integer)
+    location_id: Mapped[int] = mapped_column(Integer)
+    region_id: Mapped[Optional[int]] = mapped_column(Integer)
+    method_id: Mapped[int] = mapped_column(Integer)
+    # sorted EncounterConditionValue poke_api_ids, comma separated, empty when unconditional
+    condition_value_ids: Mapped[str] = mapped_column(String(200))
+    min_level: Mapped[int] = mapped_column(TinyInteger)
+    max_level: Mapped[int] = mapped_column(TinyInteger)
+    chance: Mapped[int] = mapped_column(TinyInteger)
+
+    __table_args__ = (
+        UniqueConstraint("pokemon_id","version_id","location_area_id","method_id","condition_value_ids",name="ux_EncounterFact_pokemon_version_area_method_cond"),
+        Index("ix_EncounterFact_location_area_id","location_area_id","version_id"),
+        Index("ix_EncounterFact_version_id","version_id"),
+        Index("ix_EncounterFact_pokemon_key","pokemon_key"),
+        Index("ix_EncounterFact_location_area_key","location_area_key"),
+    )
+
+def _fact_rows(pokemon_keys: Optional[Sequence[int]], location_area_keys: Optional[Sequence[int]]) -> List[Dict]:
+    stmt = (select(Encounter.id, Encounter.min_level, Encounter.max_level, Encounter.chance,
+                   PokemonEncounter.pokemon_key, PokemonEncounter.location_area_key,
+                   Pokemon.poke_api_id.label("pokemon_id"), Version.poke_api_id.label("version_id"),
+                   LocationArea.poke_api_id.label("location_area_id"), Location.poke_api_id.label("location_id"),
+                   Region.poke_api_id.label("region_id"), EncounterMethod.poke_api_id.label("method_id"))
+            .join(PokemonEncounter, Encounter.pokemon_encounter_key == PokemonEncounter.id)
+            .join(Pokemon, PokemonEncounter.pokemon_key == Pokemon.id)
+            .join(Version, PokemonEncounter.version_key == Version.id)
+            .join(LocationArea, PokemonEncounter.location_area_key == LocationArea.id)
+            .join(Location, LocationArea.location_key == Location.id)
+            .outerjoin(Region, Location.region_key == Region.id)
+            .join(EncounterMethod, Encounter.method_key == EncounterMethod.id))
+    criteria = _subset(PokemonEncounter.pokemon_key, PokemonEncounter.location_area_key, pokemon_keys, location_area_keys)
+    if criteria is not None:
+        stmt = stmt.where(criteria)
+
+    with Session() as session:
+        encounters = session.execute(stmt).all()
+        conditions: Dict[int, List[int]] = {}
+        encounter_ids = [row.id for row in encounters]
+        for start in range(0, len(encounter_ids), 1000):
+            link_stmt = (select(EncounterToEncounterCondValLink.c.encounter_key, EncounterConditionValue.poke_api_id)
+                         .join(EncounterConditionValue, EncounterToEncounterCondValLink.c.condition_value_key == EncounterConditionValue.id)
+                         .where(EncounterToEncounterCondValLink.c.encounter_key.in_(encounter_ids[start:start + 1000])))
+            for encounter_key, value_id in session.execute(link_stmt):
+                conditions.setdefault(encounter_key, []).append(value_id)
+
+    # Encounter is unique per (PokemonEncounter, method) and PokemonEncounter per (pokemon, version, area),
+    # so every encounter is one fact
+    return [{
+        "pokemon_key": row.pokemon_key, "location_area_key": row.location_area_key,
+        "pokemon_id": row.pokemon_id, "version_id": row.version_id, "location_area_id": row.location_area_id,
+        "location_id": row.location_id, "region_id": row.region_id, "method_id": row.method_id,
+        "condition_value_ids": ",".join(str(value_id) for value_id in sorted(conditions.get(row.id, []))),
+        "min_level": row.min_level, "max_level": row.max_level, "chance": row.chance,
+    } for row in encounters]
+
+def _subset(pokemon_column, area_column, pokemon_keys, location_area_keys):
+    criteria = []
+    if pokemon_keys is not None:
+        criteria.append(pokemon_column.in_(list(pokemon_keys)))
+    if location_area_keys is not None:
+        criteria.append(area_column.in_(list(location_area_keys)))
+    if not criteria:
+        return None
+    return or_(*criteria)
+
+def refresh(pokemon_keys: Optional[Sequence[int]] = None, location_area_keys: Optional[Sequence[int]] = None) -> int:
+    # Rebuild the facts of the given Pokemon and/or location areas (database ids), everything when neither is given
+    # Refreshes run one at a time: a Pokemon refresh and an area refresh can cover the same encounters,
+    # interleaved their delete and insert would collide on the unique index
+    with _refresh_lock:
+        facts = _fact_rows(pokemon_keys, location_area_keys)
+        for fact, fact_id in zip(facts, get_ids(len(facts))):
+            fact["id"] = fact_id
+
+        criteria = _subset(EncounterFact.pokemon_key, EncounterFact.location_area_key, pokemon_keys, location_area_keys)
+        with Session() as session:
+            stmt = delete(EncounterFact)
+            if criteria is not None:
+                stmt = stmt.where(criteria)
+            session.execute(stmt)
+            if facts:
+                session.execute(insert(EncounterFact), facts)
+            session.commit()
+    logger.debug("Refreshed %s EncounterFact rows", len(facts))
+
+    for index in _indexes:
+        index.stale = True
+    return len(facts)
+
+FACT_DTYPE = np.dtype([
+    ("pokemon_id", np.int32), ("version_id", np.int16), ("location_area_id", np.int32), ("location_id", np.int32),
+    ("region_id", np.int16), ("method_id", np.int16), ("condition_set", np.int32),
+    ("min_level", np.int16), ("max_level", np.int16), ("chance", np.int16),
+])
+
+# In-memory copy of EncounterFact, rows sorted by pokemon with sorted permutations for area and version lookups
+# Condition sets are stored once in condition_sets and referenced by index
+# Marked stale by refresh() and reloaded on the next query
+class EncounterIndex:
+    def __init__(self):
+        self.stale = True
+        self.facts = np.zeros(0, dtype=FACT_DTYPE)
+        self.condition_sets: List[frozenset] = []
+        self._by_area = np.zeros(0, dtype=np.intp)
+        self._by_version = np.zeros(0, dtype=np.intp)
+
+    @classmethod
+    def load(cls) -> "EncounterIndex":
+        index = cls()
+        index.reload()
+        register(index)
+        return index
+
+    def reload(self) -> None:
+        rows = load_all(EncounterFact)
+        condition_set_idx: Dict[str, int] = {}
+        condition_sets: List[frozenset] = []
+        facts = np.zeros(len(rows), dtype=FACT_DTYPE)
+        for idx, row in enumerate(rows):
+            set_idx = condition_set_idx.get(row.condition_value_ids)
+            if set_idx is None:
+                set_idx = condition_set_idx[row.condition_value_ids] = len(condition_sets)
+                condition_sets.append(frozenset(int(value_id) for value_id in row.condition_value_ids.split(",") if value_id))
+            facts[idx] = (row.pokemon_id, row.version_id, row.location_area_id, row.location_id, row.region_id or 0,
+                          row.method_id, set_idx, row.min_level, row.max_level, row.chance)
+
+        self.facts = facts[np.argsort(facts["pokemon_id"], kind="stable")]
+        self.condition_sets = condition_sets
+        self._by_area = np.argsort(self.facts["location_area_id"], kind="stable")
+        self._by_version = np.argsort(self.facts["version_id"], kind="stable")
+        self.stale = False
+        logger.debug("Loaded EncounterIndex with %s facts", len(self.facts))
+
+    def _rows(self, field: str, value: int) -> np.ndarray:
+        if self.stale:
+            self.reload()
+        # facts are sorted by pokemon_id, the other lookup fields go through their sorted permutation
+        order = {"location_area_id": self._by_area, "version_id": self._by_version}.get(field)
+        column = self.facts[field] if order is None else self.facts[field][order]
+        start, end = np.searchsorted(column, value, "left"), np.searchsorted(column, value, "right")
+        return self.facts[start:end] if order is None else self.facts[order[start:end]]
+
+    def _filter(self, facts: np.ndarray, version_id: Optional[int], condition_value_ids: Optional[Sequence[int]]) -> np.ndarray:
+        if version_id is not None:
+            facts = facts[facts["version_id"] == version_id]
+        if condition_value_ids is not None:
+            # Facts whose required conditions are all active
+            active = frozenset(condition_value_ids)
+            allowed = [idx for idx, condition_set in enumerate(self.condition_sets) if condition_set <= active]
+            facts = facts[np.isin(facts["condition_set"], allowed)]
+        return facts
+
+    def by_pokemon(self, pokemon_id: int, version_id: Optional[int] = None, condition_value_ids: Optional[Sequence[int]] = None) -> np.ndarray:
+        return self._filter(self._rows("pokemon_id", pokemon_id), version_id, condition_value_ids)
+
+    def by_area(self, location_area_id: int, version_id: Optional[int] = None, condition_value_ids: Optional[Sequence[int]] = None) -> np.ndarray:
+        return self._filter(self._rows("location_area_id", location_area_id), version_id, condition_value_ids)
+
+    def by_version(self, version_id: int, condition_value_ids: Optional[Sequence[int]] = None) -> np.ndarray:
+        return self._filter(self._rows("version_id", version_id), None, condition_value_ids)
+
+    def conditions(self, fact: np.void) -> frozenset:
+        return self.condition_sets[fact["condition_set"]]
+
+# Indexes marked stale by refresh()
+_indexes = IndexRegistry()
+register = _indexes.register
+unregister = _indexes.unregister
@@ -0,0 +1,165 @@
+import logging
+from collections import namedtuple
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from ReadModels import load_all
+from Evolution import ChainLink, EvolutionDetail, EvolutionTrigger
+from Items import Item
+from Locations import Location
+from Moves import Move
+from Pokemon import Pokemon, PokemonSpecies, PokemonType
+
+logger = logging.getLogger('ReadModels.EvolutionIndex')
+
+# EvolutionDetail with every reference translated to poke_api_ids
+EvolutionCondition = namedtuple("EvolutionCondition", [
+    "pokemon_id", "trigger_id", "item_id", "held_item_id", "known_move_id", "known_move_type_id", "location_id",
+    "party_species_id", "party_type_id", "trade_species_id", "gender", "min_level", "min_happiness", "min_beauty",
+    "min_affection", "needs_overworld_rain", "relative_physical_stats", "time_of_day", "turn_upside_down"])
+
+# Edge from a species to the species it evolves into, depth is the depth of to_species_id in its family
+EvolutionEdge = namedtuple("EvolutionEdge", ["from_species_id", "to_species_id", "depth", "conditions"])
+
+# Condition fields that reference other resources, usable with evolving_by()
+CONDITION_FIELDS = ("trigger_id", "item_id", "held_item_id", "known_move_id", "known_move_type_id", "location_id",
+                    "party_species_id", "party_type_id", "trade_species_id")
+
+# Transitive closure of the ChainLink forest keyed by species poke_api_id
+# Everything is precomputed in load(), queries are dict lookups plus at most a walk along one ancestor path
+class EvolutionIndex:
+    def __init__(self):
+        self.parent: Dict[int, int] = {}
+        self.children: Dict[int, Tuple[int, ...]] = {}
+        # root first, the species itself excluded
+        self.ancestors: Dict[int, Tuple[int, ...]] = {}
+        self.descendants: Dict[int, FrozenSet[int]] = {}
+        self.finals: Dict[int, FrozenSet[int]] = {}
+        self.root: Dict[int, int] = {}
+        self.families: Dict[int, FrozenSet[int]] = {}
+        self.babies: FrozenSet[int] = frozenset()
+        self.edges: Dict[int, EvolutionEdge] = {}
+        self._by_condition: Dict[Tuple[str, int], FrozenSet[int]] = {}
+
+    @classmethod
+    def load(cls) -> "EvolutionIndex":
+        index = cls()
+        species_ids = {row.id: row.poke_api_id for row in load_all(PokemonSpecies)}
+        links = load_all(ChainLink)
+        link_species = {link.id: species_ids.get(link.species_key) for link in links}
+
+        children: Dict[int, List[int]] = {}
+        for link in links:
+            species_id = link_species[link.id]
+            if species_id is None:
+                continue
+            index.parent.setdefault(species_id, None)
+            children.setdefault(species_id, [])
+            parent_id = link_species.get(link.evolves_from_key)
+            if parent_id is not None:
+                index.parent[species_id] = parent_id
+                children.setdefault(parent_id, []).append(species_id)
+        index.children = {species_id: tuple(sorted(child_ids)) for species_id, child_ids in children.items()}
+        index.babies = frozenset(link_species[link.id] for link in links if link.is_baby and link_species[link.id] is not None)
+
+        # Walk every tree from its root, building the closure top down and bottom up
+        descendants: Dict[int, set] = {}
+        finals: Dict[int, set] = {}
+        def visit(species_id: int, path: Tuple[int, ...], root_id: int) -> None:
+            index.ancestors[species_id] = path
+            index.root[species_id] = root_id
+            descendants[species_id] = set()
+            finals[species_id] = set()
+            for child_id in index.children.get(species_id, ()):
+                visit(child_id, path + (species_id,), root_id)
+                descendants[species_id] |= descendants[child_id] | {child_id}
+                finals[species_id] |= finals[child_id]
+            if not finals[species_id]:
+                finals[species_id].add(species_id)
+
+        for species_id, parent_id in index.parent.items():
+            if parent_id is None:
+                visit(species_id, (), species_id)
+                index.families[species_id] = frozenset(descendants[species_id] | {species_id})
+        index.descendants = {species_id: frozenset(ids) for species_id, ids in descendants.items()}
+        index.finals = {species_id: frozenset(ids) for species_id, ids in finals.items()}
+
+        # Evolution details belong to the link being evolved into
+        maps = {
+            "pokemon_key": {row.id: row.poke_api_id for row in load_all(Pokemon)},
+            "trigger_key": {row.id: row.poke_api_id for row in load_all(EvolutionTrigger)},
+            "item_key": {row.id: row.poke_api_id for row in load_all(Item)},
+            "known_move_key": {row.id: row.poke_api_id for row in load_all(Move)},
+            "known_move_type_key": {row.id: row.poke_api_id for row in load_all(PokemonType)},
+            "location_key": {row.id: row.poke_api_id for row in load_all(Location)},
+            "party_species_key": species_ids,
+        }
+        maps["held_item_key"] = maps["item_key"]
+        maps["party_type_key"] = maps["known_move_type_key"]
+        maps["trade_species_key"] = species_ids
+
+        conditions: Dict[int, List[EvolutionCondition]] = {}
+        for detail in load_all(EvolutionDetail):
+            species_id = link_species.get(detail.chain_link_key)
+            if species_id is None:
+                continue
+            values = {}
+            for field in EvolutionCondition._fields:
+                key_field = field[:-3] + "_key" if field.endswith("_id") else field
+                value = getattr(detail, key_field)
+                values[field] = maps[key_field].get(value) if key_field in maps else value
+            conditions.setdefault(species_id, []).append(EvolutionCondition(**values))
+
+        by_condition: Dict[Tuple[str, int], set] = {}
+        for species_id, parent_id in index.parent.items():
+            if parent_id is None:
+                continue
+            species_conditions = tuple(conditions.get(species_id, ()))
+            index.edges[species_id] = EvolutionEdge(parent_id, species_id, len(index.ancestors[species_id]), species_conditions)
+            for condition in species_conditions:
+                for field in CONDITION_FIELDS:
+                    value = getattr(condition, field)
+                    if value is not None:
+                        by_condition.setdefault((field, value), set()).add(species_id)
+        index._by_condition = {key: frozenset(ids) for key, ids in by_condition.items()}
+
+        logger.debug("Loaded EvolutionIndex: %s species, %s families, %s edges", len(index.parent), len(index.families), len(index.edges))
+        return index
+
+    def depth(self, species_id: int) -> int:
+        return len(self.ancestors[species_id])
+
+    def family(self, species_id: int) -> FrozenSet[int]:
+        return self.families[self.root[species_id]]
+
+    def final_evolutions(self, species_id: int) -> FrozenSet[int]:
+        # The species itself when it doesn't evolve
+        return self.finals[species_id]
+
+    def baby_form(self, species_id: int) -> Optional[int]:
+        root_id = self.root[species_id]
+        return root_id if root_id in self.babies else None
+
+    def evolving_by(self, field: str, resource_id: int) -> FrozenSet[int]:
+        # Species evolved into with the condition, e.g. evolving_by("item_id", 80)
+        return self._by_condition.get((field, resource_id), frozenset())
+
+    def evolving_by_item(self, item_id: int) -> FrozenSet[int]:
+        return self.evolving_by("item_id", item_id)
+
+    def path(self, from_species_id: int, to_species_id: int) -> Optional[List[int]]:
+        # Species along the evolution line from one to the other, either may be the ancestor
+        # None unless one descends from the other, siblings and other families have no line between them
+        from_line = self.ancestors[from_species_id] + (from_species_id,)
+        to_line = self.ancestors[to_species_id] + (to_species_id,)
+        if to_line[:len(from_line)] == from_line:
+            return list(to_line[len(from_line) - 1:])
+        if from_line[:len(to_line)] == to_line:
+            return list(reversed(from_line[len(to_line) - 1:]))
+        return None
+
+    def path_edges(self, from_species_id: int, to_species_id: int) -> Optional[List[EvolutionEdge]]:
+        # Edges along path(), in the direction of evolution
+        path = self.path(from_species_id, to_species_id)
+        if path is None:
+            return None
+        return [self.edges[b] if self.parent.get(b) == a else self.edges[a] for a, b in zip(path, path[1:])]
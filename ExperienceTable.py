@@ -0,0 +1,92 @@
+import logging
+from typing import Dict, Union
+
+import numpy as np
+
+from ReadModels import load_all
+from Pokemon import GrowthRate, GrowthRateExperienceLevel
+
+logger = logging.getLogger('ReadModels.ExperienceTable')
+
+ArrayLike = Union[int, np.ndarray]
+
+# Experience needed per level for every growth rate, growth rates are poke_api_ids
+# levels[rate] and experience[rate] are sorted arrays of the GrowthRateExperienceLevel rows of one rate
+# For inputs mixing growth rates all rates are also laid out in one sorted array, rate i shifted by i * _offset,
+# so a single searchsorted covers the whole batch
+class ExperienceTable:
+    def __init__(self, levels: Dict[int, np.ndarray], experience: Dict[int, np.ndarray]):
+        self.levels = levels
+        self.experience = experience
+        self.growth_rate_ids = np.array(sorted(levels), dtype=np.int32)
+
+        # Shift larger than any experience value, rates stay apart after it is added
+        self._offset = int(max((values[-1] for values in experience.values() if len(values)), default=0)) + 1
+        self._bounds = np.zeros(len(self.growth_rate_ids) + 1, dtype=np.int64)
+        self._bounds[1:] = np.cumsum([len(levels[rate]) for rate in self.growth_rate_ids.tolist()])
+        self._flat_levels = np.concatenate([levels[rate] for rate in self.growth_rate_ids.tolist()] or [np.zeros(0, dtype=np.int16)])
+        self._flat_experience = np.concatenate(
+            [experience[rate] + idx * self._offset for idx, rate in enumerate(self.growth_rate_ids.tolist())]
+            or [np.zeros(0, dtype=np.int64)])
+
+    @classmethod
+    def load(cls) -> "ExperienceTable":
+        rate_ids = {row.id: row.poke_api_id for row in load_all(GrowthRate)}
+        rows: Dict[int, list] = {}
+        for row in load_all(GrowthRateExperienceLevel):
+            rate_id = rate_ids.get(row.growth_rate_key)
+            if rate_id is not None:
+                rows.setdefault(rate_id, []).append((row.level, row.experience))
+
+        levels = {}
+        experience = {}
+        for rate_id, rate_rows in rows.items():
+            rate_rows.sort()
+            levels[rate_id] = np.array([level for level, _ in rate_rows], dtype=np.int16)
+            experience[rate_id] = np.array([exp for _, exp in rate_rows], dtype=np.int64)
+        logger.debug("Loaded ExperienceTable for %s growth rates", len(levels))
+        return cls(levels, experience)
+
+    def _rate_idx(self, growth_rate_id: ArrayLike) -> np.ndarray:
+        rate_ids = np.asarray(growth_rate_id)
+        idx = np.searchsorted(self.growth_rate_ids, rate_ids)
+        idx = np.minimum(idx, max(len(self.growth_rate_ids) - 1, 0))
+        if len(self.growth_rate_ids) == 0 or np.any(self.growth_rate_ids[idx] != rate_ids):
+            raise KeyError("Unknown growth rate in " + str(growth_rate_id))
+        return idx
+
+    def level_for_experience(self, growth_rate_id: ArrayLike, experience: ArrayLike) -> np.ndarray:
+        # Highest level whose experience requirement is met, growth_rate_id is one id or an array broadcast against experience
+        rate_idx, experience = np.broadcast_arrays(self._rate_idx(growth_rate_id), np.asarray(experience, dtype=np.int64))
+        # Below zero counts as the first level, past the last requirement as the last level
+        experience = np.clip(experience, 0, self._offset - 1)
+        pos = np.searchsorted(self._flat_experience, experience + rate_idx * self._offset, "right") - 1
+        pos = np.maximum(pos, self._bounds[rate_idx])
+        return self._flat_levels[pos]
+
+    def experience_for_level(self, growth_rate_id: ArrayLike, level: ArrayLike) -> np.ndarray:
+        # Total experience needed to reach level
+        rate_idx, level = np.broadcast_arrays(self._rate_idx(growth_rate_id), np.asarray(level))
+        start = self._bounds[rate_idx]
+        end = self._bounds[rate_idx + 1]
+        pos = start + (level - self._flat_levels[start])
+        if np.any((pos < start) | (pos >= end)):
+            raise ValueError("Level out of range in " + str(level))
+        # Levels of a rate are normally contiguous, fall back to a search for each rate otherwise
+        if np.any(self._flat_levels[pos] != level):
+            pos = np.array([self._bounds[rate] + np.searchsorted(self._flat_levels[self._bounds[rate]:self._bounds[rate + 1]], lvl)
+                            for rate, lvl in zip(rate_idx.ravel().tolist(), level.ravel().tolist())], dtype=np.int64).reshape(level.shape)
+            pos = np.minimum(pos, end - 1)
+            if np.any(self._flat_levels[pos] != level):
+                raise ValueError("Level out of range in " + str(level))
+        return self._flat_experience[pos] - rate_idx * self._offset
+
+    def experience_to_next_level(self, growth_rate_id: ArrayLike, experience: ArrayLike) -> np.ndarray:
+        # 0 at the last level
+        rate_idx, experience = np.broadcast_arrays(self._rate_idx(growth_rate_id), np.asarray(experience, dtype=np.int64))
+        experience = np.clip(experience, 0, None)
+        shifted = np.minimum(experience, self._offset - 1) + rate_idx * self._offset
+        pos = np.searchsorted(self._flat_experience, shifted, "right")
+        at_max = pos >= self._bounds[rate_idx + 1]
+        pos = np.minimum(pos, self._bounds[rate_idx + 1] - 1)
+        return np.where(at_max, 0, self._flat_experience[pos] - shifted)
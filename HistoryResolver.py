@@ -0,0 +1,108 @@
+import logging
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ReadModels import load_all
+from Games import Generation, VersionGroup
+from Moves import Move, PastMoveStatValues
+from Pokemon import PokemonType
+from TypeMatrix import TypeMatrix
+
+logger = logging.getLogger('ReadModels.HistoryResolver')
+
+# Missing values (e.g. moves without power) are stored as -1
+NONE = -1
+MOVE_FIELDS = ("power", "accuracy", "pp", "effect_chance", "type_id")
+MOVE_VALUES_DTYPE = np.dtype([(field, np.int16) for field in MOVE_FIELDS])
+
+MoveValues = namedtuple("MoveValues", MOVE_FIELDS)
+
+# Move values and Pokemon typing as they were in any version group, ids are poke_api_ids
+# move_values[version group position, move position] is precomputed for every pair, version groups in VersionGroup.order
+# A PastMoveStatValues row holds the values in effect before its version group, fields left null did not change
+# Pokemon typing and type effectiveness come from TypeMatrix, by the generation of the version group
+class HistoryResolver:
+    def __init__(self, version_group_ids: np.ndarray, version_group_generations: np.ndarray, move_ids: np.ndarray,
+                 move_values: np.ndarray, types: TypeMatrix):
+        self.version_group_ids = version_group_ids
+        self.version_group_generations = version_group_generations
+        self.move_ids = move_ids
+        self.move_values = move_values
+        self.types = types
+        self._version_group_pos: Dict[int, int] = {int(vg_id): pos for pos, vg_id in enumerate(version_group_ids)}
+        self._move_pos: Dict[int, int] = {int(move_id): pos for pos, move_id in enumerate(move_ids)}
+        # TypeMatrix type positions -> poke_api_ids, "no type" (none_idx) -> 0
+        self._type_ids = np.zeros(max(types.none_idx, len(types.type_ids)) + 1, dtype=np.int32)
+        for type_id in types.type_ids.tolist():
+            self._type_ids[types.type_index(type_id)] = type_id
+
+    @classmethod
+    def load(cls, types: Optional[TypeMatrix] = None) -> "HistoryResolver":
+        types = types or TypeMatrix.load()
+        generation_ids = {row.id: row.poke_api_id for row in load_all(Generation)}
+        type_ids = {row.id: row.poke_api_id for row in load_all(PokemonType)}
+        version_groups = sorted(load_all(VersionGroup), key=lambda row: (row.order, row.poke_api_id))
+        version_group_pos = {row.id: pos for pos, row in enumerate(version_groups)}
+        moves = sorted(load_all(Move), key=lambda row: row.poke_api_id)
+        move_pos = {row.id: pos for pos, row in enumerate(moves)}
+
+        current = np.array([tuple(NONE if value is None else value for value in
+                                  (row.power, row.accuracy, row.pp, row.effect_chance, type_ids.get(row.move_type_key)))
+                            for row in moves], dtype=MOVE_VALUES_DTYPE)
+        move_values = np.repeat(current[None, :], len(version_groups), axis=0)
+
+        # Latest change first, so for every version group the closest later change is applied last
+        past = sorted(load_all(PastMoveStatValues), key=lambda row: version_group_pos.get(row.version_group_key, -1), reverse=True)
+        for row in past:
+            pos = move_pos.get(row.move_key)
+            changed_in = version_group_pos.get(row.version_group_key)
+            if pos is None or changed_in is None:
+                continue
+            values = (row.power, row.accuracy, row.pp, row.effect_chance, type_ids.get(row.move_type_key))
+            for field, value in zip(MOVE_FIELDS, values):
+                if value is not None:
+                    move_values[field][:changed_in, pos] = value
+
+        logger.debug("Loaded HistoryResolver: %s moves over %s version groups", len(moves), len(version_groups))
+        return cls(np.array([row.poke_api_id for row in version_groups], dtype=np.int32),
+                   np.array([generation_ids.get(row.generation_key, 0) for row in version_groups], dtype=np.int32),
+                   np.array([row.poke_api_id for row in moves], dtype=np.int32),
+                   move_values, types)
+
+    def generation(self, version_group_id: int) -> int:
+        return int(self.version_group_generations[self._version_group_pos[version_group_id]])
+
+    def move(self, move_id: int, version_group_id: int) -> MoveValues:
+        values = self.move_values[self._version_group_pos[version_group_id], self._move_pos[move_id]]
+        return MoveValues(*(None if value == NONE else int(value) for value in values.tolist()))
+
+    def moves(self, move_ids: Sequence[int], version_group_id: int) -> np.ndarray:
+        # Structured MOVE_VALUES_DTYPE rows in move_ids order
+        positions = np.fromiter((self._move_pos[move_id] for move_id in move_ids), dtype=np.intp, count=len(move_ids))
+        return self.move_values[self._version_group_pos[version_group_id], positions]
+
+    def move_history(self, move_id: int) -> List[Tuple[int, MoveValues]]:
+        # (first version group, values) for every change of the move
+        column = self.move_values[:, self._move_pos[move_id]]
+        history = []
+        for pos in range(len(column)):
+            if pos == 0 or column[pos] != column[pos - 1]:
+                values = MoveValues(*(None if value == NONE else int(value) for value in column[pos].tolist()))
+                history.append((int(self.version_group_ids[pos]), values))
+        return history
+
+    def pokemon_types(self, pokemon_id: int, version_group_id: int) -> Tuple[int, Optional[int]]:
+        type_1, type_2 = self.pokemon_types_batch([pokemon_id], version_group_id)[0].tolist()
+        return type_1, type_2 or None
+
+    def pokemon_types_batch(self, pokemon_ids: Sequence[int], version_group_id: int) -> np.ndarray:
+        # [pokemon, 2] type poke_api_ids, 0 where there is no second type
+        positions = self.types.pokemon_indexes(pokemon_ids)
+        gen = self.types.generation_index(self.generation(version_group_id))
+        return self._type_ids[self.types.pokemon_types[gen, positions]]
+
+    def type_multiplier(self, attacking_type_id: int, defending_type_1_id: int, defending_type_2_id: Optional[int],
+                        version_group_id: int) -> float:
+        return self.types.multiplier(attacking_type_id, defending_type_1_id, defending_type_2_id, self.generation(version_group_id))
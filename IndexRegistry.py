@@ -0,0 +1,27 @@
+import threading
+from typing import Iterator, List
+
+# In-memory indexes kept current by the crawler, one registry per index module
+# The module exposes register/unregister and calls its indexes from its *_changed function
+class IndexRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes: List = []
+
+    def register(self, index) -> None:
+        with self._lock:
+            if index not in self._indexes:
+                self._indexes.append(index)
+
+    def unregister(self, index) -> None:
+        with self._lock:
+            if index in self._indexes:
+                self._indexes.remove(index)
+
+    def __iter__(self) -> Iterator:
+        # Iterates a copy, so indexes can be (un)registered while the crawler notifies them
+        with self._lock:
+            return iter(list(self._indexes))
+
+    def __len__(self) -> int:
+        return len(self._indexes)
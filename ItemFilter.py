@@ -0,0 +1,155 @@
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+
+from Base import ItemToItemAttributeLink, engine
+from ReadModels import load_all
+from Items import Item, ItemAttribute, ItemCategory, ItemPocket
+from IndexRegistry import IndexRegistry
+
+logger = logging.getLogger('ReadModels.ItemFilter')
+
+ITEM_DTYPE = np.dtype([
+    ("item_id", np.int32), ("category_id", np.int16), ("pocket_id", np.int16),
+    ("cost", np.int32), ("fling_power", np.int16), ("attributes", np.uint64),
+])
+ATTRIBUTE_BITS = ITEM_DTYPE["attributes"].itemsize * 8
+
+# Columnar item table sorted by item_id, ids are poke_api_ids
+# attributes is a bitmask, bit positions follow attribute_ids and new attributes get the next free bit
+# Filters are boolean masks over items, combine them with & and | as with StatStore
+class ItemFilter:
+    def __init__(self, items: np.ndarray, attribute_ids: List[int], attribute_names: Dict[str, int]):
+        if len(attribute_ids) > ATTRIBUTE_BITS:
+            raise ValueError("ItemFilter supports at most %s item attributes, got %s" % (ATTRIBUTE_BITS, len(attribute_ids)))
+        self._lock = threading.Lock()
+        self.items = items
+        self.attribute_ids = attribute_ids
+        # ItemAttribute name -> poke_api_id, e.g. "holdable"
+        self.attribute_names = attribute_names
+        self._attribute_bit: Dict[int, int] = {attribute_id: bit for bit, attribute_id in enumerate(attribute_ids)}
+
+    @classmethod
+    def build(cls) -> "ItemFilter":
+        attributes = sorted(load_all(ItemAttribute), key=lambda row: row.poke_api_id)
+        attribute_ids = {row.id: row.poke_api_id for row in attributes}
+        pockets = {row.id: row.poke_api_id for row in load_all(ItemPocket)}
+        categories = {row.id: (row.poke_api_id, pockets.get(row.pocket_key, 0)) for row in load_all(ItemCategory)}
+
+        item_attributes: Dict[int, List[int]] = {}
+        with engine.connect() as conn:
+            for item_key, attribute_key in conn.execute(select(ItemToItemAttributeLink.c.item_key, ItemToItemAttributeLink.c.item_attribute_key)):
+                if attribute_key in attribute_ids:
+                    item_attributes.setdefault(item_key, []).append(attribute_ids[attribute_key])
+
+        index = cls(np.zeros(0, dtype=ITEM_DTYPE), [row.poke_api_id for row in attributes], {row.name: row.poke_api_id for row in attributes})
+        items = sorted(load_all(Item), key=lambda row: row.poke_api_id)
+        rows = np.zeros(len(items), dtype=ITEM_DTYPE)
+        for idx, row in enumerate(items):
+            category_id, pocket_id = categories.get(row.category_key, (0, 0))
+            rows[idx] = (row.poke_api_id, category_id, pocket_id, row.cost or 0, row.fling_power or 0,
+                         index._bits(item_attributes.get(row.id, ())))
+        index.items = rows
+        logger.debug("Built ItemFilter with %s items and %s attributes", len(rows), len(attribute_ids))
+        register(index)
+        return index
+
+    def _bits(self, attribute_ids: Sequence[int]) -> int:
+        bits = 0
+        for attribute_id in attribute_ids:
+            bit = self._attribute_bit.get(attribute_id)
+            if bit is None:
+                if len(self.attribute_ids) >= ATTRIBUTE_BITS:
+                    raise ValueError("ItemFilter supports at most %s item attributes, can't add %s" % (ATTRIBUTE_BITS, attribute_id))
+                bit = self._attribute_bit[attribute_id] = len(self.attribute_ids)
+                self.attribute_ids.append(attribute_id)
+            bits |= 1 << bit
+        return bits
+
+    def _mask_of(self, attribute_ids: Sequence[int]) -> np.uint64:
+        # Known attributes only, unknown ones have no bit
+        bits = 0
+        for attribute_id in attribute_ids:
+            if attribute_id in self._attribute_bit:
+                bits |= 1 << self._attribute_bit[attribute_id]
+        return np.uint64(bits)
+
+    def upsert(self, item_id: int, category_id: int, pocket_id: int, cost: Optional[int], fling_power: Optional[int],
+               attribute_ids: Sequence[int]) -> None:
+        with self._lock:
+            row = (item_id, category_id, pocket_id, cost or 0, fling_power or 0, self._bits(attribute_ids))
+            idx = int(np.searchsorted(self.items["item_id"], item_id))
+            if idx < len(self.items) and self.items["item_id"][idx] == item_id:
+                self.items[idx] = row
+            else:
+                self.items = np.insert(self.items, idx, np.array([row], dtype=ITEM_DTYPE))
+
+    def mask(self, all_attributes: Sequence[int] = (), any_attributes: Sequence[int] = (), no_attributes: Sequence[int] = (),
+             category_ids: Optional[Sequence[int]] = None, pocket_ids: Optional[Sequence[int]] = None,
+             min_cost: Optional[int] = None, max_cost: Optional[int] = None,
+             min_fling_power: Optional[int] = None, max_fling_power: Optional[int] = None) -> np.ndarray:
+        # Attributes are ItemAttribute poke_api_ids, see attribute_names
+        items = self.items
+        mask = np.ones(len(items), dtype=bool)
+        if all_attributes:
+            # No item has an unknown attribute
+            if any(attribute_id not in self._attribute_bit for attribute_id in all_attributes):
+                return np.zeros(len(items), dtype=bool)
+            required = self._mask_of(all_attributes)
+            mask &= (items["attributes"] & required) == required
+        if any_attributes:
+            mask &= (items["attributes"] & self._mask_of(any_attributes)) != 0
+        if no_attributes:
+            mask &= (items["attributes"] & self._mask_of(no_attributes)) == 0
+        if category_ids is not None:
+            mask &= np.isin(items["category_id"], category_ids)
+        if pocket_ids is not None:
+            mask &= np.isin(items["pocket_id"], pocket_ids)
+        if min_cost is not None:
+            mask &= items["cost"] >= min_cost
+        if max_cost is not None:
+            mask &= items["cost"] <= max_cost
+        if min_fling_power is not None:
+            mask &= items["fling_power"] >= min_fling_power
+        if max_fling_power is not None:
+            mask &= items["fling_power"] <= max_fling_power
+        return mask
+
+    def filter(self, **criteria) -> np.ndarray:
+        # item poke_api_ids matching mask(**criteria)
+        return self.items["item_id"][self.mask(**criteria)]
+
+    def attributes_of(self, item_id: int) -> List[int]:
+        idx = int(np.searchsorted(self.items["item_id"], item_id))
+        if idx >= len(self.items) or self.items["item_id"][idx] != item_id:
+            return []
+        bits = int(self.items["attributes"][idx])
+        return [attribute_id for bit, attribute_id in enumerate(self.attribute_ids) if bits >> bit & 1]
+
+# Indexes kept current by the crawler
+_indexes = IndexRegistry()
+register = _indexes.register
+unregister = _indexes.unregister
+
+def item_changed(item_id: int, category_id: int, pocket_id: int, cost: Optional[int], fling_power: Optional[int],
+                 attribute_ids: Sequence[int]) -> None:
+    for index in _indexes:
+        index.upsert(item_id, category_id, pocket_id, cost, fling_power, attribute_ids)
+
+def item_processed(item: Item) -> None:
+    # POST_COMMIT_HOOKS entry for Item, nothing to do while no index is registered
+    # The committed rows are read back, the processed object is detached and its relationships may not be loaded
+    if not len(_indexes):
+        return
+    with engine.connect() as conn:
+        category = conn.execute(select(ItemCategory.poke_api_id, ItemPocket.poke_api_id)
+                                .outerjoin(ItemPocket, ItemCategory.pocket_key == ItemPocket.id)
+                                .where(ItemCategory.id == item.category_key)).first()
+        attribute_ids = conn.execute(select(ItemAttribute.poke_api_id)
+                                     .join(ItemToItemAttributeLink, ItemToItemAttributeLink.c.item_attribute_key == ItemAttribute.id)
+                                     .where(ItemToItemAttributeLink.c.item_key == item.id)).scalars().all()
+    category_id, pocket_id = category if category else (0, 0)
+    item_changed(item.poke_api_id, category_id or 0, pocket_id or 0, item.cost, item.fling_power, attribute_ids)
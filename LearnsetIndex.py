@@ -0,0 +1,187 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ArrayStore import save_arrays, load_arrays
+from ReadModels import load_all, iter_rows
+from Games import VersionGroup
+from Moves import Move, MoveLearnMethod
+from Pokemon import Pokemon, PokemonMove
+
+logger = logging.getLogger('ReadModels.LearnsetIndex')
+
+# (move, version group, learn method) poke_api_ids packed into one sortable key
+VERSION_GROUP_BITS = 12
+METHOD_BITS = 12
+
+def make_key(move_id: int, version_group_id: int, method_id: int) -> int:
+    return (move_id << (VERSION_GROUP_BITS + METHOD_BITS)) | (version_group_id << METHOD_BITS) | method_id
+
+def split_keys(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return (keys >> (VERSION_GROUP_BITS + METHOD_BITS),
+            (keys >> METHOD_BITS) & ((1 << VERSION_GROUP_BITS) - 1),
+            keys & ((1 << METHOD_BITS) - 1))
+
+def _set_bits(bits: np.ndarray, rows: np.ndarray, positions: np.ndarray) -> None:
+    # Bits are in np.packbits order, the first position is the high bit of byte 0
+    np.bitwise_or.at(bits, (rows, positions >> 3), (0x80 >> (positions & 7)).astype(np.uint8))
+
+def _widen(bits: np.ndarray, n_positions: int) -> np.ndarray:
+    n_bytes = (n_positions + 7) // 8
+    if bits.shape[1] >= n_bytes:
+        return bits
+    return np.pad(bits, ((0, 0), (0, n_bytes - bits.shape[1])))
+
+def _positions(bits: np.ndarray, n_positions: int) -> np.ndarray:
+    return np.flatnonzero(np.unpackbits(bits, count=n_positions))
+
+# Packed bitsets of learnsets
+#   pokemon_bits[key] has a bit per Pokemon (pokemon_ids order) able to learn the move in that version group by that method
+#   move_bits[pokemon] has a bit per move (move_ids order) the Pokemon can learn in any version group by any method
+# Bit positions are append-only, so update() can add Pokemon and moves without renumbering the existing bits
+class LearnsetIndex:
+    def __init__(self, pokemon_ids: np.ndarray, move_ids: np.ndarray, keys: np.ndarray,
+                 pokemon_bits: np.ndarray, move_bits: np.ndarray):
+        self.pokemon_ids = pokemon_ids
+        self.move_ids = move_ids
+        self.keys = keys
+        self.pokemon_bits = pokemon_bits
+        self.move_bits = move_bits
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self._pokemon_pos: Dict[int, int] = {int(pokemon_id): pos for pos, pokemon_id in enumerate(self.pokemon_ids)}
+        self._move_pos: Dict[int, int] = {int(move_id): pos for pos, move_id in enumerate(self.move_ids)}
+
+    def pokemon_position(self, pokemon_id: int) -> Optional[int]:
+        # Bit position of the Pokemon in pokemon_bits rows, None when it learns nothing
+        return self._pokemon_pos.get(pokemon_id)
+
+    @classmethod
+    def build(cls) -> "LearnsetIndex":
+        index = cls(np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64),
+                    np.zeros((0, 0), dtype=np.uint8), np.zeros((0, 0), dtype=np.uint8))
+        index._apply(load_all(Pokemon), iter_rows(PokemonMove))
+        logger.debug("Built LearnsetIndex: %s keys, %s pokemon, %s moves", len(index.keys), len(index.pokemon_ids), len(index.move_ids))
+        return index
+
+    def update(self, pokemon_ids: Sequence[int]) -> None:
+        # Rebuild the bits of the given Pokemon only, e.g. the ones just ingested by the crawler
+        pokemon = load_all(Pokemon, Pokemon.poke_api_id.in_(list(pokemon_ids)))
+        if not pokemon:
+            return
+        rows = iter_rows(PokemonMove, PokemonMove.pokemon_key.in_([row.id for row in pokemon]))
+        self._apply(pokemon, rows)
+        logger.debug("Updated LearnsetIndex for %s pokemon", len(pokemon))
+
+    def _apply(self, pokemon: List[tuple], move_rows: Iterable[tuple]) -> None:
+        move_ids = {row.id: row.poke_api_id for row in load_all(Move)}
+        version_group_ids = {row.id: row.poke_api_id for row in load_all(VersionGroup)}
+        method_ids = {row.id: row.poke_api_id for row in load_all(MoveLearnMethod)}
+        pokemon_ids = {row.id: row.poke_api_id for row in pokemon}
+
+        entries = set()
+        for row in move_rows:
+            if row.pokemon_key not in pokemon_ids or row.move_key not in move_ids:
+                continue
+            entries.add((pokemon_ids[row.pokemon_key], move_ids[row.move_key],
+                         version_group_ids.get(row.version_group_key, 0), method_ids.get(row.move_learn_method_key, 0)))
+
+        # Copies, the current arrays may be read-only memory maps
+        pokemon_bits = np.array(self.pokemon_bits)
+        move_bits = np.array(self.move_bits)
+
+        # New Pokemon and moves get the next free bit positions
+        new_pokemon = sorted(set(pokemon_ids.values()) - self._pokemon_pos.keys())
+        new_moves = sorted({entry[1] for entry in entries} - self._move_pos.keys())
+        self.pokemon_ids = np.concatenate([self.pokemon_ids, np.array(new_pokemon, dtype=np.int32)])
+        self.move_ids = np.concatenate([self.move_ids, np.array(new_moves, dtype=np.int32)])
+        self._reindex()
+        pokemon_bits = _widen(pokemon_bits, len(self.pokemon_ids))
+        move_bits = np.pad(_widen(move_bits, len(self.move_ids)), ((0, len(new_pokemon)), (0, 0)))
+
+        # Clear the bits of the Pokemon being (re)applied
+        positions = np.array([self._pokemon_pos[pokemon_id] for pokemon_id in pokemon_ids.values()], dtype=np.intp)
+        clear = np.zeros(pokemon_bits.shape[1], dtype=np.uint8)
+        np.bitwise_or.at(clear, positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8))
+        pokemon_bits &= ~clear
+        move_bits[positions] = 0
+
+        # Merge in new keys, keeping keys sorted
+        entry_keys = np.array([make_key(move_id, vg_id, method_id) for _, move_id, vg_id, method_id in entries], dtype=np.int64)
+        new_keys = np.setdiff1d(entry_keys, self.keys)
+        if len(new_keys):
+            keys = np.union1d(self.keys, new_keys)
+            merged = np.zeros((len(keys), pokemon_bits.shape[1]), dtype=np.uint8)
+            merged[np.searchsorted(keys, self.keys)] = pokemon_bits
+            self.keys = keys
+            pokemon_bits = merged
+
+        if entries:
+            entry_pokemon = np.array([self._pokemon_pos[entry[0]] for entry in entries], dtype=np.intp)
+            entry_moves = np.array([self._move_pos[entry[1]] for entry in entries], dtype=np.intp)
+            _set_bits(pokemon_bits, np.searchsorted(self.keys, entry_keys), entry_pokemon)
+            _set_bits(move_bits, entry_pokemon, entry_moves)
+
+        self.pokemon_bits = pokemon_bits
+        self.move_bits = move_bits
+
+    def save(self, directory: str) -> None:
+        save_arrays(directory, {
+            "pokemon_ids": self.pokemon_ids,
+            "move_ids": self.move_ids,
+            "keys": self.keys,
+            "pokemon_bits": self.pokemon_bits,
+            "move_bits": self.move_bits,
+        })
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "LearnsetIndex":
+        arrays, _ = load_arrays(directory, mmap)
+        return cls(arrays["pokemon_ids"], arrays["move_ids"], arrays["keys"], arrays["pokemon_bits"], arrays["move_bits"])
+
+    def learner_bits(self, move_id: int, version_group_id: int, method_ids: Optional[Sequence[int]] = None) -> np.ndarray:
+        # Union over the learn methods, any method when method_ids is None
+        low = make_key(move_id, version_group_id, 0)
+        if method_ids is None:
+            rows = slice(np.searchsorted(self.keys, low), np.searchsorted(self.keys, low + (1 << METHOD_BITS)))
+            return np.bitwise_or.reduce(self.pokemon_bits[rows], axis=0, initial=0).astype(np.uint8)
+        bits = np.zeros(self.pokemon_bits.shape[1], dtype=np.uint8)
+        for method_id in method_ids:
+            key = low | method_id
+            row = np.searchsorted(self.keys, key)
+            if row < len(self.keys) and self.keys[row] == key:
+                bits |= self.pokemon_bits[row]
+        return bits
+
+    def to_pokemon_ids(self, bits: np.ndarray) -> np.ndarray:
+        return self.pokemon_ids[_positions(bits, len(self.pokemon_ids))]
+
+    def learners(self, move_id: int, version_group_id: int, method_ids: Optional[Sequence[int]] = None) -> np.ndarray:
+        return self.to_pokemon_ids(self.learner_bits(move_id, version_group_id, method_ids))
+
+    def learners_of_all(self, move_ids: Sequence[int], version_group_id: int, method_ids: Optional[Sequence[int]] = None) -> np.ndarray:
+        bits = np.full(self.pokemon_bits.shape[1], 0xFF, dtype=np.uint8)
+        for move_id in move_ids:
+            bits &= self.learner_bits(move_id, version_group_id, method_ids)
+        return self.to_pokemon_ids(bits)
+
+    def learners_of_any(self, move_ids: Sequence[int], version_group_id: int, method_ids: Optional[Sequence[int]] = None) -> np.ndarray:
+        bits = np.zeros(self.pokemon_bits.shape[1], dtype=np.uint8)
+        for move_id in move_ids:
+            bits |= self.learner_bits(move_id, version_group_id, method_ids)
+        return self.to_pokemon_ids(bits)
+
+    def moves_of(self, pokemon_id: int) -> np.ndarray:
+        # Every move the Pokemon learns in any version group
+        return self.move_ids[_positions(self.move_bits[self._pokemon_pos[pokemon_id]], len(self.move_ids))]
+
+    def moves_in(self, pokemon_id: int, version_group_id: int, method_ids: Optional[Sequence[int]] = None) -> np.ndarray:
+        pos = self._pokemon_pos[pokemon_id]
+        has_bit = (self.pokemon_bits[:, pos >> 3] & (0x80 >> (pos & 7))) != 0
+        key_moves, key_version_groups, key_methods = split_keys(self.keys)
+        mask = has_bit & (key_version_groups == version_group_id)
+        if method_ids is not None:
+            mask &= np.isin(key_methods, method_ids)
+        return np.unique(key_moves[mask]).astype(np.int32)
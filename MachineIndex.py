@@ -0,0 +1,96 @@
+import logging
+from typing import Dict, Sequence
+
+import numpy as np
+
+from ArrayStore import save_arrays, load_arrays
+from ReadModels import load_all
+from Games import VersionGroup
+from Items import Item
+from Moves import Move, Machine
+
+logger = logging.getLogger('ReadModels.MachineIndex')
+
+ID_BITS = 32
+
+def _keys(version_group_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    return (version_group_ids.astype(np.int64) << ID_BITS) | ids.astype(np.int64)
+
+# Machine rows as parallel arrays of poke_api_ids, sorted by (version group, move)
+# item_order is the permutation sorting them by (version group, item), so both directions are binary searches
+class MachineIndex:
+    def __init__(self, machine_ids: np.ndarray, item_ids: np.ndarray, move_ids: np.ndarray, version_group_ids: np.ndarray):
+        self.machine_ids = machine_ids
+        self.item_ids = item_ids
+        self.move_ids = move_ids
+        self.version_group_ids = version_group_ids
+        self._move_keys = _keys(version_group_ids, move_ids)
+        self.item_order = np.argsort(_keys(version_group_ids, item_ids), kind="stable")
+        self._item_keys = _keys(version_group_ids, item_ids)[self.item_order]
+
+    @classmethod
+    def build(cls) -> "MachineIndex":
+        item_ids = {row.id: row.poke_api_id for row in load_all(Item)}
+        move_ids = {row.id: row.poke_api_id for row in load_all(Move)}
+        version_group_ids = {row.id: row.poke_api_id for row in load_all(VersionGroup)}
+        rows = [(row.poke_api_id, item_ids[row.item_key], move_ids[row.move_key], version_group_ids[row.version_group_key])
+                for row in load_all(Machine)
+                if row.item_key in item_ids and row.move_key in move_ids and row.version_group_key in version_group_ids]
+        rows.sort(key=lambda row: (row[3], row[2], row[1]))
+        columns = np.array(rows, dtype=np.int32).reshape(len(rows), 4)
+        logger.debug("Built MachineIndex with %s machines", len(rows))
+        return cls(columns[:, 0].copy(), columns[:, 1].copy(), columns[:, 2].copy(), columns[:, 3].copy())
+
+    def save(self, directory: str) -> None:
+        save_arrays(directory, {
+            "machine_ids": self.machine_ids,
+            "item_ids": self.item_ids,
+            "move_ids": self.move_ids,
+            "version_group_ids": self.version_group_ids,
+        })
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "MachineIndex":
+        arrays, _ = load_arrays(directory, mmap)
+        return cls(arrays["machine_ids"], arrays["item_ids"], arrays["move_ids"], arrays["version_group_ids"])
+
+    def items_for_move(self, move_id: int, version_group_id: int) -> np.ndarray:
+        # Machine items teaching the move in the version group, usually one
+        key = (version_group_id << ID_BITS) | move_id
+        start, end = np.searchsorted(self._move_keys, key, "left"), np.searchsorted(self._move_keys, key, "right")
+        return self.item_ids[start:end]
+
+    def moves_for_item(self, item_id: int, version_group_id: int) -> np.ndarray:
+        key = (version_group_id << ID_BITS) | item_id
+        start, end = np.searchsorted(self._item_keys, key, "left"), np.searchsorted(self._item_keys, key, "right")
+        return self.move_ids[self.item_order[start:end]]
+
+    def machines_in(self, version_group_id: int) -> Dict[int, int]:
+        # item -> move for every machine of the version group
+        start = np.searchsorted(self._move_keys, version_group_id << ID_BITS)
+        end = np.searchsorted(self._move_keys, (version_group_id + 1) << ID_BITS)
+        return dict(zip(self.item_ids[start:end].tolist(), self.move_ids[start:end].tolist()))
+
+    def machine_items(self, move_ids: Sequence[int], version_group_id: int, missing: int = 0) -> np.ndarray:
+        # Batch lookup, the first machine item teaching each move, missing where no machine does
+        keys = _keys(np.full(len(move_ids), version_group_id), np.asarray(move_ids))
+        pos = np.searchsorted(self._move_keys, keys)
+        found = pos < len(self._move_keys)
+        found[found] = self._move_keys[pos[found]] == keys[found]
+        result = np.full(len(keys), missing, dtype=np.int32)
+        result[found] = self.item_ids[pos[found]]
+        return result
+
+    def machine_moves(self, item_ids: Sequence[int], version_group_id: int, missing: int = 0) -> np.ndarray:
+        # Batch lookup of the move taught by each machine item
+        keys = _keys(np.full(len(item_ids), version_group_id), np.asarray(item_ids))
+        pos = np.searchsorted(self._item_keys, keys)
+        found = pos < len(self._item_keys)
+        found[found] = self._item_keys[pos[found]] == keys[found]
+        result = np.full(len(keys), missing, dtype=np.int32)
+        result[found] = self.move_ids[self.item_order[pos[found]]]
+        return result
+
+    def version_groups_for_move(self, move_id: int) -> np.ndarray:
+        # Version groups having a machine for the move
+        return np.unique(self.version_group_ids[self.move_ids == move_id])
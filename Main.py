@@ -8,6 +8,8 @@ import Games
 import Items
 import Locations
 import Moves
+import NegativeCache
+import EncounterFacts
 from Pokemon import Pokemon
 import TextEntries
 
@@ -0,0 +1,69 @@
+import os
+import logging
+import argparse
+from typing import Dict, List, Type
+
+import numpy as np
+
+from ArrayStore import save_arrays
+from Base import Base, config
+from ReadModels import load_all
+from TextEntries import Language, TextEntry
+
+logger = logging.getLogger('ReadModels.NameBundles')
+
+def fallback_languages() -> List[str]:
+    # Configured languages tried after the requested one, by Language.name, for NameResolver
+    return [name.strip() for name in config.get("names", "fallback_languages", fallback="en").split(",") if name.strip()]
+
+def name_classes() -> Dict[str, Type[TextEntry]]:
+    # Every *Name text entry class, keyed by class name
+    classes = {}
+    for mapper in Base.registry.mappers:
+        cls = mapper.class_
+        if issubclass(cls, TextEntry) and cls is not TextEntry and cls.__name__.endswith("Name") and "object_ref" in mapper.relationships:
+            classes[cls.__name__] = cls
+    return classes
+
+def build_bundles(directory: str) -> List[str]:
+    # One ArrayStore directory per Language, named after it. Per name class:
+    #   <class>.ids: object poke_api_ids, sorted
+    #   <class>.offsets: name i is data[offsets[i]:offsets[i + 1]] in the language's UTF-8 blob
+    languages = {row.id: row for row in load_all(Language)}
+    # language key -> class name -> [(object poke_api_id, name)]
+    entries: Dict[int, Dict[str, list]] = {language_key: {} for language_key in languages}
+    for class_name, cls in sorted(name_classes().items()):
+        target = cls.__mapper__.relationships["object_ref"].mapper.class_
+        object_ids = {row.id: row.poke_api_id for row in load_all(target)}
+        for row in load_all(cls):
+            object_id = object_ids.get(row.object_key)
+            if object_id is not None and row.language_key in entries and row.text_entry is not None:
+                entries[row.language_key].setdefault(class_name, []).append((object_id, row.text_entry))
+
+    built = []
+    for language_key, language_entries in entries.items():
+        language = languages[language_key]
+        arrays: Dict[str, np.ndarray] = {}
+        blob: List[bytes] = []
+        position = 0
+        for class_name, names in language_entries.items():
+            names.sort(key=lambda entry: entry[0])
+            encoded = [name.encode("utf-8") for _, name in names]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(name) for name in encoded])
+            arrays[class_name + ".ids"] = np.array([object_id for object_id, _ in names], dtype=np.int32)
+            arrays[class_name + ".offsets"] = offsets + position
+            blob.extend(encoded)
+            position += int(offsets[-1])
+        arrays["data"] = np.frombuffer(b"".join(blob), dtype=np.uint8)
+        save_arrays(os.path.join(directory, language.name), arrays,
+                    {"language_id": language.poke_api_id, "language": language.name, "classes": sorted(language_entries)})
+        built.append(language.name)
+    logger.info("Built name bundles for %s languages in %s", len(built), directory)
+    return built
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile per language name bundles")
+    parser.add_argument("directory")
+    args = parser.parse_args()
+    build_bundles(args.directory)
@@ -0,0 +1,47 @@
+import os
+import logging
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from ArrayStore import load_arrays
+
+logger = logging.getLogger('ReadModels.NameBundles')
+
+# Readers of the name bundles written by NameBundleBuilder, numpy only so UI processes don't load the ORM or config
+
+# Names of one language, arrays are read-only memory maps shared by every process opening the bundle
+class NameBundle:
+    def __init__(self, directory: str, mmap: bool = True):
+        self.arrays, self.meta = load_arrays(directory, mmap)
+        self.language = self.meta["language"]
+
+    def name(self, class_name: str, object_id: int) -> Optional[str]:
+        ids = self.arrays.get(class_name + ".ids")
+        if ids is None:
+            return None
+        idx = int(np.searchsorted(ids, object_id))
+        if idx >= len(ids) or ids[idx] != object_id:
+            return None
+        offsets = self.arrays[class_name + ".offsets"]
+        return self.arrays["data"][offsets[idx]:offsets[idx + 1]].tobytes().decode("utf-8")
+
+# Resolves names in a language, falling back along the chain when it has no entry for an object
+class NameResolver:
+    def __init__(self, directory: str, language: str, fallbacks: Sequence[str] = (), mmap: bool = True):
+        # fallbacks are Language names tried in order, e.g. NameBundleBuilder.fallback_languages() from config.properties
+        chain = [language] + [name for name in fallbacks if name != language]
+        self.bundles = [NameBundle(os.path.join(directory, name), mmap) for name in chain
+                        if os.path.isdir(os.path.join(directory, name))]
+
+    def name(self, name_class: Union[str, type], object_id: int) -> Optional[str]:
+        # name_class is a *Name class or its name, e.g. PokemonName with a species poke_api_id
+        class_name = name_class if isinstance(name_class, str) else name_class.__name__
+        for bundle in self.bundles:
+            name = bundle.name(class_name, object_id)
+            if name is not None:
+                return name
+        return None
+
+    def names(self, name_class: Union[str, type], object_ids: Sequence[int]) -> List[Optional[str]]:
+        return [self.name(name_class, object_id) for object_id in object_ids]
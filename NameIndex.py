@@ -0,0 +1,177 @@
+import bisect
+import logging
+import threading
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Type
+
+from Base import Base, PokeApiResource
+from ReadModels import load_all
+from TextEntries import TextEntry
+from TextSearch import normalize
+from IndexRegistry import IndexRegistry
+
+logger = logging.getLogger('ReadModels.NameIndex')
+
+# Limit on the number of strings a prefix lookup collects
+MAX_PREFIX_MATCHES = 200
+MIN_SIMILARITY = 0.3
+
+NameMatch = namedtuple("NameMatch", ["type", "id", "name", "score"])
+
+def _normalize(text: str) -> str:
+    # Identifiers use hyphens where localized names use spaces, "mr-mime" and "Mr. Mime" both become "mr mime"
+    return " ".join(normalize(text).replace("-", " ").replace(".", " ").split())
+
+def _trigrams(text: str) -> Set[str]:
+    padded = "  " + text + " "
+    return {padded[idx:idx + 3] for idx in range(len(padded) - 2)}
+
+_named_types: Optional[Dict[Type[Base], List[Type[TextEntry]]]] = None
+
+def named_types() -> Dict[Type[Base], List[Type[TextEntry]]]:
+    # Every PokeApiResource with a name column, with the *Name text entry classes naming it
+    # Walks the mappers on first use only, the crawler asks after every processed object
+    global _named_types
+    if _named_types is not None:
+        return _named_types
+    types: Dict[Type[Base], List[Type[TextEntry]]] = {}
+    for mapper in Base.registry.mappers:
+        cls = mapper.class_
+        if issubclass(cls, PokeApiResource) and "name" in mapper.columns:
+            types.setdefault(cls, [])
+    for mapper in Base.registry.mappers:
+        cls = mapper.class_
+        if issubclass(cls, TextEntry) and cls.__name__.endswith("Name") and "object_ref" in mapper.relationships:
+            target = mapper.relationships["object_ref"].mapper.class_
+            if target in types:
+                types[target].append(cls)
+    _named_types = types
+    return types
+
+# Trigram and prefix index over the names of every named resource, identifiers and localized names alike
+# Matches are (type, poke_api_id) pairs, type being the class name, e.g. ("PokemonSpecies", 122) for "mr. mime"
+class NameIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._strings: List[str] = []
+        self._string_idx: Dict[str, int] = {}
+        self._trigram_counts: List[int] = []
+        self._owners: Dict[int, Set[Tuple[str, int]]] = {}
+        self._object_strings: Dict[Tuple[str, int], Set[int]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        # normalized strings with at least one owner, sorted for prefix lookups
+        self._sorted: List[str] = []
+
+    @classmethod
+    def build(cls) -> "NameIndex":
+        index = cls()
+        for T, name_classes in named_types().items():
+            index._index_type(T, name_classes)
+        logger.debug("Built NameIndex: %s names of %s objects", len(index._owners), len(index._object_strings))
+        register(index)
+        return index
+
+    def _index_type(self, T: Type[Base], name_classes: Sequence[Type[TextEntry]], criteria: Sequence = ()) -> None:
+        rows = load_all(T, *criteria)
+        names: Dict[int, List[str]] = {row.id: [row.name] for row in rows if row.name}
+        for name_class in name_classes:
+            name_criteria = [name_class.object_key.in_([row.id for row in rows])] if criteria else []
+            for entry in load_all(name_class, *name_criteria):
+                if entry.object_key in names and entry.text_entry:
+                    names[entry.object_key].append(entry.text_entry)
+        # Old names are replaced under one lock hold, so a lookup never sees an object without names
+        with self._lock:
+            for row in rows:
+                self._clear((T.__name__, row.poke_api_id))
+                for name in names.get(row.id, ()):
+                    self._add((T.__name__, row.poke_api_id), name)
+
+    def _add(self, owner: Tuple[str, int], name: str) -> None:
+        text = _normalize(name)
+        if not text:
+            return
+        idx = self._string_idx.get(text)
+        if idx is None:
+            idx = self._string_idx[text] = len(self._strings)
+            self._strings.append(text)
+            self._trigram_counts.append(len(_trigrams(text)))
+        owners = self._owners.get(idx)
+        if owners is None:
+            owners = self._owners[idx] = set()
+            for trigram in _trigrams(text):
+                self._postings.setdefault(trigram, set()).add(idx)
+            bisect.insort(self._sorted, text)
+        owners.add(owner)
+        self._object_strings.setdefault(owner, set()).add(idx)
+
+    def _clear(self, owner: Tuple[str, int]) -> None:
+        with self._lock:
+            for idx in self._object_strings.pop(owner, ()):
+                owners = self._owners[idx]
+                owners.discard(owner)
+                if owners:
+                    continue
+                # Last owner gone, the string leaves the postings but keeps its slot for reuse
+                del self._owners[idx]
+                text = self._strings[idx]
+                for trigram in _trigrams(text):
+                    postings = self._postings[trigram]
+                    postings.discard(idx)
+                    if not postings:
+                        del self._postings[trigram]
+                del self._sorted[bisect.bisect_left(self._sorted, text)]
+
+    def update(self, T: Type[Base], poke_api_ids: Iterable[int]) -> None:
+        # Reindex the names of the given objects, e.g. after they were ingested
+        # Types without a name column are skipped before anything is loaded
+        name_classes = named_types().get(T)
+        if name_classes is None:
+            return
+        self._index_type(T, name_classes, [T.poke_api_id.in_(list(poke_api_ids))])
+
+    def lookup(self, query: str, types: Optional[Sequence[str]] = None, limit: int = 10,
+               min_similarity: float = MIN_SIMILARITY) -> List[NameMatch]:
+        # Ranked best first, exact and prefix matches score above 1, trigram (typo tolerant) matches their Jaccard similarity
+        text = _normalize(query)
+        if not text:
+            return []
+        types = set(types) if types else None
+        scores: Dict[int, float] = {}
+        with self._lock:
+            start = bisect.bisect_left(self._sorted, text)
+            end = bisect.bisect_left(self._sorted, text + "\U0010FFFF")
+            for string in self._sorted[start:min(end, start + MAX_PREFIX_MATCHES)]:
+                scores[self._string_idx[string]] = 1.0 + len(text) / len(string)
+
+            query_trigrams = _trigrams(text)
+            shared: Dict[int, int] = {}
+            for trigram in query_trigrams:
+                for idx in self._postings.get(trigram, ()):
+                    shared[idx] = shared.get(idx, 0) + 1
+            for idx, count in shared.items():
+                similarity = count / (len(query_trigrams) + self._trigram_counts[idx] - count)
+                if similarity >= min_similarity and similarity > scores.get(idx, 0.0):
+                    scores[idx] = similarity
+
+            best: Dict[Tuple[str, int], Tuple[float, str]] = {}
+            for idx, score in scores.items():
+                for owner in self._owners.get(idx, ()):
+                    if types is not None and owner[0] not in types:
+                        continue
+                    if score > best.get(owner, (0.0, ""))[0]:
+                        best[owner] = (score, self._strings[idx])
+
+        matches = [NameMatch(owner[0], owner[1], name, score) for owner, (score, name) in best.items()]
+        matches.sort(key=lambda match: (-match.score, match.type, match.id))
+        return matches[:limit]
+
+# Indexes kept current by the crawler
+_indexes = IndexRegistry()
+register = _indexes.register
+unregister = _indexes.unregister
+
+def objects_changed(T: Type[Base], poke_api_ids: Sequence[int]) -> None:
+    if not len(_indexes) or T not in named_types():
+        return
+    for index in _indexes:
+        index.update(T, poke_api_ids)
@@ -0,0 +1,86 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Tuple
+
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import Integer, String, DateTime, UniqueConstraint, select, delete
+
+from Base import Base, Session, config, get_next_id
+
+logger = logging.getLogger('DB')
+
+NOT_FOUND_TTL = timedelta(days=config.getint("cache", "not_found_ttl_days", fallback=7))
+# Guards MissingResource._cache and its one-time load, the prefetch workers use them concurrently
+_lock = threading.Lock()
+
+# (resource type, poke_api_id) pairs that PokeAPI answered with a 404
+# Persisted so gaps in the id ranges cost a single request across runs, until the entry expires
+class MissingResource(Base):
+    __tablename__ = "MissingResource"
+    id: Mapped[int] = mapped_column(Integer,primary_key=True)
+    resource_type: Mapped[str] = mapped_column(String(100))
+    poke_api_id: Mapped[int] = mapped_column(Integer)
+    expires_at: Mapped[datetime] = mapped_column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint("resource_type","poke_api_id",name="ux_MissingResource_Type_PokeApiId"),
+    )
+
+    _cache: Dict[Tuple[str, int], "MissingResource"] = {}
+    _loaded: bool = False
+
+    def __init__(self, resource_type: str, poke_api_id: int, expires_at: datetime):
+        self.id = get_next_id()
+        self.resource_type = resource_type
+        self.poke_api_id = poke_api_id
+        self.expires_at = expires_at
+
+    @classmethod
+    def _load(cls) -> None:
+        # Read every unexpired entry once, expired ones are dropped. Called with _lock held
+        if cls._loaded:
+            return
+        now = datetime.now()
+        with Session() as session:
+            session.execute(delete(cls).where(cls.expires_at <= now))
+            session.commit()
+            for missing in session.scalars(select(cls)):
+                cls._cache[(missing.resource_type, missing.poke_api_id)] = missing
+        logger.debug("Loaded %s MissingResource entries", len(cls._cache))
+        cls._loaded = True
+
+    @classmethod
+    def is_missing(cls, resource_type: str, poke_api_id: int) -> bool:
+        with _lock:
+            cls._load()
+            missing = cls._cache.get((resource_type, poke_api_id))
+            if missing is None:
+                return False
+            if missing.expires_at <= datetime.now():
+                del cls._cache[(resource_type, poke_api_id)]
+                return False
+            return True
+
+    @classmethod
+    def record(cls, resource_type: str, poke_api_id: int) -> "MissingResource":
+        expires_at = datetime.now() + NOT_FOUND_TTL
+        with _lock:
+            cls._load()
+            missing = cls._cache.get((resource_type, poke_api_id))
+        if missing is None:
+            with Session() as session:
+                missing = session.scalars(select(cls).filter_by(resource_type=resource_type, poke_api_id=poke_api_id)).first()
+        if missing:
+            missing.expires_at = expires_at
+        else:
+            missing = cls(resource_type=resource_type, poke_api_id=poke_api_id, expires_at=expires_at)
+
+        with Session() as session:
+            missing = session.merge(missing)
+            session.commit()
+
+        logger.debug("Recorded MissingResource %s: %s until %s", resource_type, poke_api_id, expires_at)
+        with _lock:
+            cls._cache[(resource_type, poke_api_id)] = missing
+        return missing
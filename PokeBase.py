@@ -1,13 +1,22 @@
 import time
+import atexit
 import logging
-from typing import Callable, List, TYPE_CHECKING, Dict, Type
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, TYPE_CHECKING, Dict, Type, Tuple, Hashable, Any
 
 from sqlalchemy import delete, inspect, select
 from requests.exceptions import HTTPError
 import pokebase
 from pokebase.interface import APIResource
 
-from Base import Session, PokeApiResource
+from Base import Session, PokeApiResource, config
+from NegativeCache import MissingResource
+from Dependencies import iter_dependencies
+import TextSearch
+import NameIndex
+import ItemFilter
+import EncounterFacts
 from Berries import Berry, BerryFlavor, BerryFlavorLink, BerryFirmness
 from Contests import ContestType, ContestEffect, SuperContestEffect
 from Evolution import EvolutionChain, ChainLink, EvolutionDetail, EvolutionTrigger
@@ -22,10 +31,94 @@ from TextEntries import Language, TextEntry, VersionTextEntry, VersionGroupTextE
 
 logger = logging.getLogger('PokeBase')
 REQ_WAIT_TIME = 1000
+PREFETCH_WORKERS = config.getint("api", "prefetch_workers", fallback=4)
+# Payloads kept for a later process_* call at most, see _evict_prefetched
+PREFETCH_LIMIT = config.getint("api", "prefetch_limit", fallback=256)
 
 class ProcessingInProgressException(Exception):
     pass
 
+class Flight:
+    __slots__ = ("owner", "future")
+
+    def __init__(self, owner: int):
+        self.owner = owner
+        self.future = Future()
+
+# Single-flight for resource processing keyed by (type, id_)
+# The first thread to process a resource does the fetch-and-persist, concurrent callers wait on its Future
+# Re-entry from the owning thread keeps the old behaviour (cache lookup / ProcessingInProgressException)
+# and so does a wait that would close a cycle between threads
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, Flight] = {}
+        self._waiting: Dict[int, Hashable] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def _closes_cycle(self, owner: int, me: int) -> bool:
+        # Follow owner -> key it waits on -> owner of that key, until we either get back to this thread or run out
+        seen = set()
+        while owner not in seen:
+            if owner == me:
+                return True
+            seen.add(owner)
+            key = self._waiting.get(owner)
+            flight = self._flights.get(key) if key is not None else None
+            if flight is None:
+                return False
+            owner = flight.owner
+        return False
+
+    def _wait(self, key: Hashable, flight: Flight, me: int) -> Any:
+        try:
+            return flight.future.result()
+        finally:
+            with self._lock:
+                self._waiting.pop(me, None)
+
+    def wait(self, key: Hashable) -> Tuple[bool, Any]:
+        # Wait for a flight running in another thread, returns (waited, result)
+        me = threading.get_ident()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None or self._closes_cycle(flight.owner, me):
+                return False, None
+            self._waiting[me] = key
+        logger.debug("SingleFlight: waiting for %s", key)
+        return True, self._wait(key, flight, me)
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        me = threading.get_ident()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = Flight(me)
+                self._flights[key] = flight
+            elif self._closes_cycle(flight.owner, me):
+                logger.debug("SingleFlight: %s already being processed", key)
+                raise ProcessingInProgressException
+            else:
+                self._waiting[me] = key
+
+        if flight.owner != me:
+            logger.debug("SingleFlight: waiting for %s", key)
+            return self._wait(key, flight, me)
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as ex:
+            flight.future.set_exception(ex)
+            raise
+        else:
+            flight.future.set_result(result)
+        finally:
+            with self._lock:
+                del self._flights[key]
+        return result
+
 POKEBASE_API: Dict[Type[PokeApiResource], Callable] = {
     # Berries
     Berry: pokebase.berry,
@@ -86,13 +179,52 @@ POKEBASE_API: Dict[Type[PokeApiResource], Callable] = {
     Language: pokebase.language
 }
 
+# Called with the committed object once a resource has been processed, keeps derived tables current
+POST_COMMIT_HOOKS: Dict[Type[PokeApiResource], List[Callable[[PokeApiResource], None]]] = {
+    Pokemon: [lambda pokemon: EncounterFacts.refresh(pokemon_keys=[pokemon.id])],
+    LocationArea: [lambda area: EncounterFacts.refresh(location_area_keys=[area.id])],
+    Item: [ItemFilter.item_processed],
+}
+
+class RequestSlot:
+    # One API request at a time, each starting REQ_WAIT_TIME after the previous one completed
+    # Background requests (prefetches) only take the slot while no foreground request is waiting for it
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._busy = False
+        self._foreground_waiting = 0
+        self._last_req = 0
+
+    def acquire(self, background: bool = False) -> None:
+        with self._cond:
+            if not background:
+                self._foreground_waiting += 1
+            try:
+                while True:
+                    wait_time = self._last_req + REQ_WAIT_TIME - round(time.time() * 1000)
+                    blocked = self._busy or (background and self._foreground_waiting > 0)
+                    if not blocked and wait_time <= 0:
+                        break
+                    if not blocked:
+                        logger.debug("Sleeping for API rate limit: %d ms", wait_time)
+                    # Checked again when the slot is released or the wait is over
+                    self._cond.wait(None if blocked else wait_time / 1000.0)
+                self._busy = True
+            finally:
+                if not background:
+                    self._foreground_waiting -= 1
+
+    def release(self) -> None:
+        with self._cond:
+            self._busy = False
+            self._last_req = round(time.time() * 1000)
+            self._cond.notify_all()
+
+_request_slot = RequestSlot()
+
 def rate_limit(func: Callable):
-    def rate_limited_func(self,*args, **kwargs):
-        time_since_last_req = round(time.time() * 1000) - self.__class__._last_req
-        if time_since_last_req < REQ_WAIT_TIME:
-            sleep_time = (REQ_WAIT_TIME - time_since_last_req)/1000.0
-            logger.debug("Sleeping for API rate limit: %d ms" ,sleep_time*1000)
-            time.sleep(sleep_time)
+    def rate_limited_func(self, *args, background: bool = False, **kwargs):
+        _request_slot.acquire(background)
 
         ret = None
         try:
@@ -104,8 +236,8 @@ def rate_limit(func: Callable):
                 logger.info("404 Error encountered for request. Skipping request and continuing")
             else: """
             raise ex
-
-        self.__class__._last_req = round(time.time() * 1000)
+        finally:
+            _request_slot.release()
 
         return ret
 
@@ -130,6 +262,12 @@ def api_resource(T: Type[PokeApiResource]):
             type_name = T.__tablename__
             logger.debug("Process %s: id_: %s", type_name, id_)
 
+            # Another thread is already processing this resource, use its result
+            waited, api_object = self._flights.wait((T, id_))
+            if waited:
+                logger.debug("Process %s: id_: %s processed by another thread", type_name, id_)
+                return api_object
+
             api_object, needs_update = T.get_from_cache(id_)
             if api_object:
                 logger.debug("Process %s: got from cache: %s, needs_update: %s", type_name, id_, needs_update)
@@ -139,8 +277,12 @@ def api_resource(T: Type[PokeApiResource]):
                     #logger.error("TESTING: after get_from_cache merge, current identity_map: %s", self._session.identity_map.items()) """
             else:
                 logger.debug("Process %s: id_: %s not in cache, retrieving from api", type_name, id_)
-            if needs_update:
+
+            def update_api_resource(api_object):
                 object_data = self.get_object_data(T, id_, ignore_404)
+                if object_data is None:
+                    logger.debug("Process %s: id_: %s not found in api, skipping", type_name, id_)
+                    return api_object
                 api_url = object_data.url
                 if api_url in self._processing:
                     logger.debug("Process %s: id_: %s already being processed", type_name, id_)
@@ -237,6 +379,9 @@ def api_resource(T: Type[PokeApiResource]):
                                 text_entries_relationships[rel_name] = rel
 
                         logger.debug("Process %s: Found %s TextEntry relationships to proecess", type_name, len(text_entries_relationships))
+                        # Changes passed on to the search indexes once committed
+                        added_text_entries: List[TextEntry] = []
+                        deleted_text_entry_ids: List[int] = []
                         #with Session() as session:
                         #api_object = session.merge(api_object)
                         for text_relationship_name, text_relationship in text_entries_relationships.items():
@@ -338,6 +483,7 @@ def api_resource(T: Type[PokeApiResource]):
                                         #logger.error("TESTING after append language: object_text.id: %s object_key: %s language_key: %s api_object.id: %s api_object type: %s", object_text.id, object_text.object_key, object_text.language_key, api_object.id, type_name)
                                         object_text = session.merge(object_text)
                                         session.flush()
+                                        added_text_entries.append(object_text)
 
 
 
@@ -351,9 +497,16 @@ def api_resource(T: Type[PokeApiResource]):
                                 text_ids_to_delete: List[int] = [ text_entry.id for text_entry in text_entry_map.values() ]
                                 #with Session() as session:
                                 session.execute(delete(text_class).where(text_class.id.in_(text_ids_to_delete)))
+                                deleted_text_entry_ids.extend(text_ids_to_delete)
                                 #session.commit()
                                 #self._session.execute(delete(text_class).where(text_class.id.in_(text_ids_to_delete)))
                         session.commit()
+                        if added_text_entries or deleted_text_entry_ids:
+                            TextSearch.entries_changed(added_text_entries, deleted_text_entry_ids)
+
+                    for hook in POST_COMMIT_HOOKS.get(T, []):
+                        hook(api_object)
+                    NameIndex.objects_changed(T, [api_object.poke_api_id])
 
 
                     #if hasattr(T, 'names'):
@@ -380,31 +533,117 @@ def api_resource(T: Type[PokeApiResource]):
                 finally:
                     self._processing.remove(api_url)
 
+                return api_object
+
+            if needs_update:
+                api_object = self._flights.do((T, id_), update_api_resource, api_object)
+
             return api_object
 
         return process_api_resource
     return api_resource_wrapper
 
 class PokeBaseWrapper:
-    _last_req: int = 0
-
     def __init__(self):
         #self._session = Session()
-        self._processing = set()
+        # In-progress keys are tracked per thread, they guard against recursion within one call chain
+        # Concurrent processing of the same resource is coordinated by _flights
+        self._local = threading.local()
+        self._flights = SingleFlight()
+
+        # Payloads of referenced resources requested ahead of their process_* call
+        self._prefetch_lock = threading.Lock()
+        self._prefetched: Dict[Tuple[Type[PokeApiResource], int], Future] = {}
+        self._prefetcher = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch") if PREFETCH_WORKERS > 0 else None
+        atexit.register(self.close)
 
         # Make sure stats are loaded before anything else
         #for stat_id in range(1,7):
         #    self.process_stat(stat_id, skip_nature = True)
 
+    @property
+    def _processing(self) -> set:
+        processing = getattr(self._local, "processing", None)
+        if processing is None:
+            processing = self._local.processing = set()
+        return processing
+
     """ def close(self):
         self._session.close() """
 
-    @rate_limit
+    def close(self) -> None:
+        # Stops the prefetch workers, queued prefetches are cancelled and running ones finish
+        with self._prefetch_lock:
+            prefetcher = self._prefetcher
+            self._prefetcher = None
+            self._prefetched.clear()
+        if prefetcher is not None:
+            prefetcher.shutdown(cancel_futures=True)
+
     def get_object_data(self, T: Type[PokeApiResource], id_: int, ignore_404: bool = False) -> APIResource:
+        # Known 404s are skipped before the rate limit is applied
+        # Strict requests still go to the API, a 404 there aborts processing anyway
+        if ignore_404 and MissingResource.is_missing(T.__name__, id_):
+            logger.debug("get_object_data: %s id_: %s previously returned 404, skipping request", T.__name__, id_)
+            return None
+
+        object_data = None
+        with self._prefetch_lock:
+            prefetched = self._prefetched.pop((T, id_), None)
+        if prefetched:
+            try:
+                object_data = prefetched.result()
+            except Exception as ex:
+                logger.debug("get_object_data: prefetch of %s id_: %s failed, requesting again: %s", T.__name__, id_, ex)
+        # Prefetches ignore 404s, repeat the request only so a strict caller still gets the error
+        if object_data is None and ignore_404 and MissingResource.is_missing(T.__name__, id_):
+            logger.debug("get_object_data: prefetch of %s id_: %s returned 404, skipping request", T.__name__, id_)
+            return None
+        if object_data is None:
+            object_data = self.request_object_data(T, id_, ignore_404)
+
+        if object_data is not None:
+            self.prefetch_dependencies(T, object_data)
+        return object_data
+
+    def prefetch_dependencies(self, T: Type[PokeApiResource], object_data: APIResource) -> None:
+        # Request every resource referenced by object_data that isn't cached yet, in the background
+        # Known 404s are filtered before taking the lock, MissingResource may have to query the database
+        candidates = [(D, dep_id) for D, dep_id in iter_dependencies(T, object_data)
+                      if dep_id not in D._cache and not MissingResource.is_missing(D.__name__, dep_id)]
+        scheduled = 0
+        with self._prefetch_lock:
+            if self._prefetcher is None:
+                return
+            for D, dep_id in candidates:
+                if (D, dep_id) in self._prefetched or (D, dep_id) in self._flights:
+                    continue
+                if len(self._prefetched) >= PREFETCH_LIMIT:
+                    self._evict_prefetched()
+                    if len(self._prefetched) >= PREFETCH_LIMIT:
+                        break
+                self._prefetched[(D, dep_id)] = self._prefetcher.submit(self.request_object_data, D, dep_id, True, background=True)
+                scheduled += 1
+        if scheduled:
+            logger.debug("prefetch_dependencies: scheduled %s prefetches for %s id_: %s", scheduled, T.__name__, object_data.id_)
+
+    def _evict_prefetched(self) -> None:
+        # Called with _prefetch_lock held
+        # process_* methods skip links that are already stored, so some payloads are never asked for:
+        # drop finished ones, oldest first, until there is room again
+        for key in [key for key, future in self._prefetched.items() if future.done()]:
+            if len(self._prefetched) < PREFETCH_LIMIT:
+                break
+            del self._prefetched[key]
+
+    @rate_limit
+    def request_object_data(self, T: Type[PokeApiResource], id_: int, ignore_404: bool = False) -> APIResource:
         object_data = None
         try: 
             object_data = POKEBASE_API[T](id_)
         except HTTPError as ex:
+            if ex.response.status_code == 404:
+                MissingResource.record(T.__name__, id_)
             if ex.response.status_code == 404 and ignore_404:
                 logger.info("404 Error encountered for request. Skipping request and continuing")
             else: 
@@ -0,0 +1,102 @@
+import logging
+import argparse
+from typing import Dict, Optional
+
+import numpy as np
+
+from ArrayStore import save_arrays, load_arrays
+from ReadModels import load_all
+from Games import Pokedex, PokedexEntry
+from Pokemon import PokemonSpecies
+
+logger = logging.getLogger('ReadModels.PokedexIndex')
+
+NATIONAL = "national"
+NONE = -1
+
+# Entry order of every Pokedex, ids are poke_api_ids and NONE means no entry (entry numbers start at 0, e.g. Victini). Per Pokedex:
+#   <pokedex>.species[entry number] -> species id
+#   <pokedex>.numbers[species id] -> entry number
+#   <pokedex>.order: species ids in entry number order, for paging
+class PokedexIndex:
+    def __init__(self, arrays: Dict[str, np.ndarray], pokedex_names: Dict[int, str]):
+        self.arrays = arrays
+        self.pokedex_names = pokedex_names
+        self._pokedex_ids: Dict[str, int] = {name: pokedex_id for pokedex_id, name in pokedex_names.items()}
+
+    @classmethod
+    def build(cls) -> "PokedexIndex":
+        pokedexes = {row.id: row for row in load_all(Pokedex)}
+        species_ids = {row.id: row.poke_api_id for row in load_all(PokemonSpecies)}
+        entries: Dict[int, list] = {}
+        for row in load_all(PokedexEntry):
+            species_id = species_ids.get(row.pokemon_species_key)
+            if row.pokedex_key in pokedexes and species_id is not None:
+                entries.setdefault(pokedexes[row.pokedex_key].poke_api_id, []).append((row.entry_number, species_id))
+
+        max_species_id = max(species_ids.values(), default=0)
+        arrays = {}
+        for pokedex_id, pokedex_entries in entries.items():
+            pokedex_entries.sort()
+            numbers = np.array([number for number, _ in pokedex_entries], dtype=np.int32)
+            species = np.array([species_id for _, species_id in pokedex_entries], dtype=np.int32)
+            by_number = np.full(int(numbers.max()) + 1, NONE, dtype=np.int32)
+            by_number[numbers] = species
+            by_species = np.full(max_species_id + 1, NONE, dtype=np.int32)
+            by_species[species] = numbers
+            arrays[str(pokedex_id) + ".species"] = by_number
+            arrays[str(pokedex_id) + ".numbers"] = by_species
+            arrays[str(pokedex_id) + ".order"] = species
+        logger.debug("Built PokedexIndex for %s pokedexes", len(entries))
+        return cls(arrays, {row.poke_api_id: row.name for row in pokedexes.values() if row.poke_api_id in entries})
+
+    def save(self, directory: str) -> None:
+        save_arrays(directory, self.arrays, {"pokedexes": {str(pokedex_id): name for pokedex_id, name in self.pokedex_names.items()}})
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "PokedexIndex":
+        arrays, meta = load_arrays(directory, mmap)
+        return cls(arrays, {int(pokedex_id): name for pokedex_id, name in meta["pokedexes"].items()})
+
+    def pokedex_id(self, name: str) -> int:
+        return self._pokedex_ids[name]
+
+    def species_at(self, pokedex_id: int, entry_number: int) -> Optional[int]:
+        by_number = self.arrays[str(pokedex_id) + ".species"]
+        if not 0 <= entry_number < len(by_number) or by_number[entry_number] == NONE:
+            return None
+        return int(by_number[entry_number])
+
+    def number_of(self, pokedex_id: int, species_id: int) -> Optional[int]:
+        by_species = self.arrays[str(pokedex_id) + ".numbers"]
+        if not 0 < species_id < len(by_species) or by_species[species_id] == NONE:
+            return None
+        return int(by_species[species_id])
+
+    def numbers_of(self, pokedex_id: int, species_ids: np.ndarray) -> np.ndarray:
+        # Batch number_of(), NONE where the species has no entry
+        by_species = self.arrays[str(pokedex_id) + ".numbers"]
+        species_ids = np.asarray(species_ids)
+        in_range = (species_ids > 0) & (species_ids < len(by_species))
+        return np.where(in_range, by_species[np.where(in_range, species_ids, 0)], NONE)
+
+    def page(self, pokedex_id: int, offset: int = 0, limit: int = 50) -> np.ndarray:
+        # Species ids of the entries at positions offset..offset + limit in entry order
+        return self.arrays[str(pokedex_id) + ".order"][offset:offset + limit]
+
+    def size(self, pokedex_id: int) -> int:
+        return len(self.arrays[str(pokedex_id) + ".order"])
+
+    def national_to_regional(self, pokedex_id: int, national_number: int) -> Optional[int]:
+        species_id = self.species_at(self.pokedex_id(NATIONAL), national_number)
+        return None if species_id is None else self.number_of(pokedex_id, species_id)
+
+    def regional_to_national(self, pokedex_id: int, entry_number: int) -> Optional[int]:
+        species_id = self.species_at(pokedex_id, entry_number)
+        return None if species_id is None else self.number_of(self.pokedex_id(NATIONAL), species_id)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Pokedex ordering arrays")
+    parser.add_argument("directory")
+    args = parser.parse_args()
+    PokedexIndex.build().save(args.directory)
@@ -0,0 +1,92 @@
+import logging
+from collections import namedtuple
+from typing import Any, Dict, Iterator, List, Type
+
+from sqlalchemy import Select, select, inspect
+from sqlalchemy.orm import Mapper
+
+from Base import Base, engine
+import Berries
+import Contests
+import Encounters
+import Evolution
+import Games
+import Items
+import Locations
+import Moves
+import Pokemon
+import TextEntries
+
+logger = logging.getLogger('ReadModels')
+
+# Read-only row types for every mapped class
+# These are plain namedtuples (immutable, no per-instance __dict__) and are filled
+# straight from Core select() rows, so no identity map, instrumentation or relationship loading is involved
+READ_MODELS: Dict[Type[Base], Type[tuple]] = {}
+_SELECTS: Dict[Type[Base], Select] = {}
+
+def _build_read_model(mapper: Mapper) -> None:
+    cls = mapper.class_
+    attrs = list(mapper.column_attrs)
+    fields = [attr.key for attr in attrs]
+    READ_MODELS[cls] = namedtuple(cls.__name__ + "Row", fields)
+
+    stmt = select(*[attr.columns[0].label(attr.key) for attr in attrs])
+
+    # single table inheritance (TextEntry, GameIndex, ContestEffect)
+    # restrict the select to this class and its subclasses
+    if mapper.inherits is not None and mapper.polymorphic_on is not None:
+        identities = [m.polymorphic_identity for m in mapper.self_and_descendants if m.polymorphic_identity is not None]
+        stmt = stmt.where(mapper.polymorphic_on.in_(identities))
+
+    _SELECTS[cls] = stmt
+
+Base.registry.configure()
+for _mapper in Base.registry.mappers:
+    _build_read_model(_mapper)
+logger.debug("Generated %s read models", len(READ_MODELS))
+
+def _ensure(T: Type[Base]) -> None:
+    # Classes mapped after this module was imported are built on first use
+    if T not in READ_MODELS:
+        _build_read_model(inspect(T))
+
+def read_model(T: Type[Base]) -> Type[tuple]:
+    _ensure(T)
+    return READ_MODELS[T]
+
+def select_rows(T: Type[Base]) -> Select:
+    # Columns are labelled with the mapped attribute names, so further where/order_by clauses can be added
+    _ensure(T)
+    return _SELECTS[T]
+
+def iter_rows(T: Type[Base], *criteria, order_by=None, batch_size: int = 1000) -> Iterator[tuple]:
+    _ensure(T)
+    model = READ_MODELS[T]
+    stmt = _SELECTS[T]
+    if criteria:
+        stmt = stmt.where(*criteria)
+    if order_by is not None:
+        stmt = stmt.order_by(order_by)
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+        for row in result:
+            yield model._make(row)
+
+def load_all(T: Type[Base], *criteria, order_by=None) -> List[tuple]:
+    _ensure(T)
+    model = READ_MODELS[T]
+    stmt = _SELECTS[T]
+    if criteria:
+        stmt = stmt.where(*criteria)
+    if order_by is not None:
+        stmt = stmt.order_by(order_by)
+
+    with engine.connect() as conn:
+        rows = [model._make(row) for row in conn.execute(stmt)]
+    logger.debug("Loaded %s %s rows", len(rows), T.__name__)
+    return rows
+
+def load_map(T: Type[Base], *criteria, key: str = "id") -> Dict[Any, tuple]:
+    return {getattr(row, key): row for row in iter_rows(T, *criteria)}
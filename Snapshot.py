@@ -0,0 +1,149 @@
+import os
+import json
+import struct
+import hashlib
+import logging
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger('ReadModels.Snapshot')
+
+# Reader and writer of the snapshot artifact, numpy and the standard library only so opening one stays cheap
+# The artifact is compiled from the database by SnapshotCompiler
+# File layout:
+#   magic, format version, header length, sha256 of everything after the fixed prefix
+#   JSON header describing every array (dtype, shape, offset)
+#   arrays, each starting on an ALIGNMENT byte boundary
+MAGIC = b"PKSNAP\0\0"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+PREFIX = struct.Struct("<8sII32s")
+
+SPECIES_DTYPE = np.dtype([
+    ("species_id", np.int32), ("generation_id", np.int16), ("evolves_from_id", np.int32),
+    ("egg_group_1_id", np.int16), ("egg_group_2_id", np.int16), ("growth_rate_id", np.int16),
+    ("gender_rate", np.int8), ("capture_rate", np.int16), ("is_baby", np.bool_), ("is_legendary", np.bool_), ("is_mythical", np.bool_),
+])
+MOVE_DTYPE = np.dtype([
+    ("move_id", np.int32), ("type_id", np.int16), ("damage_class_id", np.int16), ("generation_id", np.int16),
+    ("power", np.int16), ("accuracy", np.int16), ("pp", np.int16), ("priority", np.int8),
+])
+TYPE_DTYPE = np.dtype([("type_id", np.int16), ("generation_id", np.int16), ("damage_class_id", np.int16)])
+ABILITY_DTYPE = np.dtype([("ability_id", np.int32), ("generation_id", np.int16), ("is_main_series", np.bool_)])
+ITEM_DTYPE = np.dtype([("item_id", np.int32), ("cost", np.int32), ("fling_power", np.int16), ("category_id", np.int16)])
+
+# kind -> id field of its rows, the compiler adds a localized name table for every kind but pokemon
+KIND_ID_FIELDS: Dict[str, str] = {
+    "pokemon": "pokemon_id",
+    "species": "species_id",
+    "move": "move_id",
+    "type": "type_id",
+    "ability": "ability_id",
+    "item": "item_id",
+}
+
+def _string_table(values: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    # UTF-8 blob plus offsets, string i is data[offsets[i]:offsets[i + 1]]
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+def add_strings(arrays: Dict[str, np.ndarray], name: str, values: Sequence[str]) -> None:
+    arrays[name + ".offsets"], arrays[name + ".data"] = _string_table(values)
+
+def write_artifact(path: str, arrays: Dict[str, np.ndarray], meta: Dict) -> Dict:
+    # Lay the arrays out first so the header can record their offsets
+    entries = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        entries[name] = {"dtype": np.lib.format.dtype_to_descr(array.dtype), "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+    header = {"format_version": FORMAT_VERSION, "meta": meta, "arrays": entries}
+
+    # Offsets in the header are relative to the aligned start of the data section
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = -(-(PREFIX.size + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+    header_bytes = header_bytes.ljust(data_start - PREFIX.size, b" ")
+
+    digest = hashlib.sha256(header_bytes)
+    chunks = []
+    position = 0
+    for name, array in arrays.items():
+        padding = entries[name]["offset"] - position
+        chunk = b"\0" * padding + np.ascontiguousarray(array).tobytes()
+        digest.update(chunk)
+        chunks.append(chunk)
+        position += len(chunk)
+
+    with open(path + ".tmp", "wb") as artifact:
+        artifact.write(PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes), digest.digest()))
+        artifact.write(header_bytes)
+        for chunk in chunks:
+            artifact.write(chunk)
+    os.replace(path + ".tmp", path)
+    return header
+
+class SnapshotError(Exception):
+    pass
+
+# Read-only view of a compiled snapshot, arrays are views into one memory map of the file
+# Opening only checks the magic and format version, verify=True (or verify()) also hashes the whole file
+class Snapshot:
+    def __init__(self, path: str, verify: bool = False):
+        self.path = path
+        self._mmap = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, header_length, self._checksum = PREFIX.unpack(self._mmap[:PREFIX.size].tobytes())
+        if magic != MAGIC:
+            raise SnapshotError("Not a snapshot artifact: " + path)
+        if version != FORMAT_VERSION:
+            raise SnapshotError("Unsupported snapshot format version %s in %s" % (version, path))
+        if verify:
+            self.verify()
+
+        header = json.loads(self._mmap[PREFIX.size:PREFIX.size + header_length].tobytes())
+        self.meta = header["meta"]
+        data_start = PREFIX.size + header_length
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, entry in header["arrays"].items():
+            dtype = np.lib.format.descr_to_dtype(entry["dtype"])
+            self.arrays[name] = np.ndarray(tuple(entry["shape"]), dtype=dtype, buffer=self._mmap, offset=data_start + entry["offset"])
+        logger.debug("Opened snapshot %s with %s arrays", path, len(self.arrays))
+
+    def verify(self) -> None:
+        if hashlib.sha256(self._mmap[PREFIX.size:]).digest() != self._checksum:
+            raise SnapshotError("Checksum mismatch in " + self.path)
+
+    def _string(self, name: str, idx: int) -> str:
+        offsets = self.arrays[name + ".offsets"]
+        return self.arrays[name + ".data"][offsets[idx]:offsets[idx + 1]].tobytes().decode("utf-8")
+
+    def _index(self, kind: str, object_id: int) -> Optional[int]:
+        column = self.arrays[kind][KIND_ID_FIELDS[kind]]
+        idx = int(np.searchsorted(column, object_id))
+        if idx < len(column) and column[idx] == object_id:
+            return idx
+        return None
+
+    def row(self, kind: str, object_id: int) -> Optional[np.void]:
+        # kind is one of KIND_ID_FIELDS, object_id a poke_api_id
+        idx = self._index(kind, object_id)
+        return None if idx is None else self.arrays[kind][idx]
+
+    def identifier(self, kind: str, object_id: int) -> Optional[str]:
+        idx = self._index(kind, object_id)
+        return None if idx is None else self._string(kind + ".name", idx)
+
+    def localized_name(self, kind: str, object_id: int, language_id: int) -> Optional[str]:
+        keys = self.arrays["names." + kind + ".keys"]
+        key = (language_id << 32) | object_id
+        idx = int(np.searchsorted(keys, key))
+        if idx < len(keys) and keys[idx] == key:
+            return self._string("names." + kind, idx)
+        return None
+
+    def abilities(self, pokemon_id: int) -> Optional[np.ndarray]:
+        idx = self._index("pokemon", pokemon_id)
+        return None if idx is None else self.arrays["pokemon.abilities"][idx]
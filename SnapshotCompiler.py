@@ -0,0 +1,113 @@
+import logging
+import argparse
+from datetime import datetime
+from typing import Dict, List, Type
+
+import numpy as np
+
+from Base import Base
+from ReadModels import load_all
+from StatStore import StatStore
+from Games import Generation
+from Items import Item, ItemCategory
+from Moves import Move, DamageClass
+from Pokemon import Pokemon, PokemonSpecies, PokemonType, PokemonAbility, EggGroup, GrowthRate
+from TextEntries import Language, PokemonName, MoveName, PokemonTypeName, PokemonAbilityName, ItemName
+from Snapshot import KIND_ID_FIELDS, SPECIES_DTYPE, MOVE_DTYPE, TYPE_DTYPE, ABILITY_DTYPE, ITEM_DTYPE, add_strings, write_artifact
+
+logger = logging.getLogger('ReadModels.Snapshot')
+
+# kind -> localized name class
+NAME_CLASSES: Dict[str, Type[Base]] = {
+    "species": PokemonName,
+    "move": MoveName,
+    "type": PokemonTypeName,
+    "ability": PokemonAbilityName,
+    "item": ItemName,
+}
+
+def _ids(T: Type[Base]) -> Dict[int, int]:
+    return {row.id: row.poke_api_id for row in load_all(T)}
+
+def _add_rows(arrays: Dict[str, np.ndarray], kind: str, dtype: np.dtype, rows: List[tuple], names: List[str]) -> None:
+    table = np.array(rows, dtype=dtype)
+    order = np.argsort(table[KIND_ID_FIELDS[kind]], kind="stable")
+    arrays[kind] = table[order]
+    add_strings(arrays, kind + ".name", [names[idx] for idx in order])
+
+def _add_localized_names(arrays: Dict[str, np.ndarray], kind: str, object_ids: Dict[int, int], language_ids: Dict[int, int]) -> None:
+    # Sorted by (language, object) so a name is found with one binary search on the combined key
+    entries = []
+    for row in load_all(NAME_CLASSES[kind]):
+        object_id = object_ids.get(row.object_key)
+        language_id = language_ids.get(row.language_key)
+        if object_id is not None and language_id is not None:
+            entries.append(((language_id << 32) | object_id, row.text_entry))
+    entries.sort(key=lambda entry: entry[0])
+    arrays["names." + kind + ".keys"] = np.array([key for key, _ in entries], dtype=np.int64)
+    add_strings(arrays, "names." + kind, [text for _, text in entries])
+
+def compile_snapshot(path: str) -> Dict:
+    generation_ids = _ids(Generation)
+    type_ids = _ids(PokemonType)
+    damage_class_ids = _ids(DamageClass)
+    species_ids = _ids(PokemonSpecies)
+    move_ids = _ids(Move)
+    ability_ids = _ids(PokemonAbility)
+    item_ids = _ids(Item)
+    language_ids = _ids(Language)
+    egg_group_ids = _ids(EggGroup)
+    growth_rate_ids = _ids(GrowthRate)
+    item_category_ids = _ids(ItemCategory)
+
+    arrays: Dict[str, np.ndarray] = {}
+
+    # Pokemon reuse the StatStore layout, abilities alongside
+    stats = StatStore.load().rows
+    pokemon = {row.poke_api_id: row for row in load_all(Pokemon)}
+    arrays["pokemon"] = stats
+    arrays["pokemon.abilities"] = np.array(
+        [[ability_ids.get(getattr(pokemon[pokemon_id], field), 0) for field in ("ability_1_key", "ability_2_key", "hidden_ability_key")]
+         for pokemon_id in stats["pokemon_id"].tolist()], dtype=np.int32).reshape(len(stats), 3)
+    add_strings(arrays, "pokemon.name", [pokemon[pokemon_id].name for pokemon_id in stats["pokemon_id"].tolist()])
+
+    species = load_all(PokemonSpecies)
+    _add_rows(arrays, "species", SPECIES_DTYPE, [
+        (row.poke_api_id, generation_ids.get(row.generation_key, 0), species_ids.get(row.evolves_from_species_key, 0),
+         egg_group_ids.get(row.egg_group_1_key, 0), egg_group_ids.get(row.egg_group_2_key, 0), growth_rate_ids.get(row.growth_rate_key, 0),
+         row.gender_rate, row.capture_rate, bool(row.is_baby), bool(row.is_legendary), bool(row.is_mythical))
+        for row in species], [row.name for row in species])
+
+    moves = load_all(Move)
+    _add_rows(arrays, "move", MOVE_DTYPE, [
+        (row.poke_api_id, type_ids.get(row.move_type_key, 0), damage_class_ids.get(row.damage_class_key, 0),
+         generation_ids.get(row.generation_key, 0), row.power or 0, row.accuracy or 0, row.pp or 0, row.priority or 0)
+        for row in moves], [row.name for row in moves])
+
+    types = load_all(PokemonType)
+    _add_rows(arrays, "type", TYPE_DTYPE, [
+        (row.poke_api_id, generation_ids.get(row.generation_introduced_key, 0), damage_class_ids.get(row.damage_class_key, 0))
+        for row in types], [row.name for row in types])
+
+    abilities = load_all(PokemonAbility)
+    _add_rows(arrays, "ability", ABILITY_DTYPE, [
+        (row.poke_api_id, generation_ids.get(row.generation_key, 0), bool(row.is_main_series))
+        for row in abilities], [row.name for row in abilities])
+
+    items = load_all(Item)
+    _add_rows(arrays, "item", ITEM_DTYPE, [
+        (row.poke_api_id, row.cost or 0, row.fling_power or 0, item_category_ids.get(row.category_key, 0))
+        for row in items], [row.name for row in items])
+
+    for kind, object_ids in (("species", species_ids), ("move", move_ids), ("type", type_ids), ("ability", ability_ids), ("item", item_ids)):
+        _add_localized_names(arrays, kind, object_ids, language_ids)
+
+    header = write_artifact(path, arrays, {"created_at": datetime.now().isoformat()})
+    logger.info("Compiled snapshot %s with %s arrays", path, len(arrays))
+    return header
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the database into a read-only snapshot artifact")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    compile_snapshot(args.path)
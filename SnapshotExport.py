@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# pyarrow is only needed by this exporter, the rest of the project runs without it
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+from sqlalchemy import Boolean, DateTime, Float, SmallInteger, String, Table, distinct, func, select
+from sqlalchemy.sql.elements import ColumnElement
+
+from Base import Base, engine
+# Imported for their mapped classes, so every table is part of the metadata
+import ReadModels
+import NegativeCache
+import EncounterFacts
+
+logger = logging.getLogger('ReadModels.SnapshotExport')
+
+BATCH_SIZE = 10000
+# String columns with more distinct values than this are written as plain strings instead of dictionary encoded
+DICTIONARY_MAX_VALUES = 1 << 16
+MANIFEST_FILE = "manifest.json"
+FORMATS = ("parquet", "arrow")
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("SnapshotExport needs pyarrow, install it with: pip install pyarrow")
+
+def _arrow_type(column) -> "pa.DataType":
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    if isinstance(column_type, SmallInteger):
+        return pa.int16()
+    if isinstance(column_type, Float):
+        return pa.float64()
+    if isinstance(column_type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column_type, String):
+        return pa.string()
+    return pa.int64()
+
+class Export:
+    # One output file: a select over a table, optionally restricted to one discriminator value
+    def __init__(self, name: str, table: Table, columns: List[ColumnElement], where: Optional[ColumnElement] = None):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.where = where
+
+def _exports() -> Iterator[Export]:
+    # Single table inheritance hierarchies (TextEntry, GameIndex, ContestEffect) are split by discriminator,
+    # each part gets only the columns its class maps
+    split_tables = set()
+    for mapper in sorted(Base.registry.mappers, key=lambda mapper: mapper.class_.__name__):
+        if mapper.polymorphic_on is None or mapper.polymorphic_identity is None:
+            continue
+        split_tables.add(mapper.local_table.name)
+        columns = [attr.columns[0] for attr in mapper.column_attrs]
+        yield Export(mapper.local_table.name + "." + mapper.class_.__name__, mapper.local_table, columns,
+                     mapper.polymorphic_on == mapper.polymorphic_identity)
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in split_tables:
+            yield Export(table.name, table, list(table.columns))
+
+def _dictionary_columns(conn, export: Export, string_columns: List[int]) -> List[int]:
+    # Low cardinality string columns (languages, version names, ...), the only ones worth a dictionary
+    selected = []
+    for idx in string_columns:
+        stmt = select(func.count(distinct(export.columns[idx])))
+        if export.where is not None:
+            stmt = stmt.where(export.where)
+        if conn.execute(stmt).scalar() <= DICTIONARY_MAX_VALUES:
+            selected.append(idx)
+    return selected
+
+class DictionaryEncoder:
+    # Cumulative dictionary for an Arrow IPC string column, later batches only append to it
+    # so the writer can emit dictionary deltas instead of replacements (which the file format doesn't allow)
+    # Only used for columns within DICTIONARY_MAX_VALUES, so the dictionary stays small
+    def __init__(self):
+        self.values: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.dictionary = pa.array([], type=pa.string())
+
+    def encode(self, values: List[Optional[str]]) -> "pa.DictionaryArray":
+        indices = []
+        for value in values:
+            if value is None:
+                indices.append(None)
+                continue
+            idx = self.index.get(value)
+            if idx is None:
+                idx = self.index[value] = len(self.values)
+                self.values.append(value)
+            indices.append(idx)
+        if len(self.values) != len(self.dictionary):
+            self.dictionary = pa.array(self.values, type=pa.string())
+        return pa.DictionaryArray.from_arrays(pa.array(indices, type=pa.int32()), self.dictionary)
+
+def _export(export: Export, directory: str, file_format: str) -> Dict:
+    names = [column.name for column in export.columns]
+    types = [_arrow_type(column) for column in export.columns]
+    string_columns = [idx for idx, arrow_type in enumerate(types) if arrow_type == pa.string()]
+    with engine.connect() as conn:
+        dictionary_columns = _dictionary_columns(conn, export, string_columns)
+
+    if file_format == "arrow":
+        fields = [pa.field(name, pa.dictionary(pa.int32(), pa.string()) if idx in dictionary_columns else arrow_type)
+                  for idx, (name, arrow_type) in enumerate(zip(names, types))]
+        encoders = {idx: DictionaryEncoder() for idx in dictionary_columns}
+    else:
+        fields = [pa.field(name, arrow_type) for name, arrow_type in zip(names, types)]
+    schema = pa.schema(fields)
+
+    file_name = export.name + (".parquet" if file_format == "parquet" else ".arrow")
+    path = os.path.join(directory, file_name)
+    if file_format == "parquet":
+        writer = pq.ParquetWriter(path, schema, use_dictionary=[names[idx] for idx in dictionary_columns], compression="zstd")
+    else:
+        writer = pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+    stmt = select(*export.columns)
+    if export.where is not None:
+        stmt = stmt.where(export.where)
+
+    rows = 0
+    with writer, engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(stmt)
+        for batch in result.partitions(BATCH_SIZE):
+            columns = list(zip(*batch))
+            arrays = []
+            for idx, values in enumerate(columns):
+                if file_format == "arrow" and idx in encoders:
+                    arrays.append(encoders[idx].encode(list(values)))
+                else:
+                    arrays.append(pa.array(values, type=types[idx]))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            rows += len(batch)
+
+    logger.info("Exported %s rows of %s to %s", rows, export.name, file_name)
+    return {
+        "name": export.name,
+        "table": export.table.name,
+        "file": file_name,
+        "rows": rows,
+        "columns": [{"name": field.name, "type": str(field.type)} for field in schema],
+    }
+
+def export_snapshot(directory: str, file_format: str = "parquet") -> Dict:
+    if file_format not in FORMATS:
+        raise ValueError("Unknown snapshot format: " + file_format)
+    _require_pyarrow()
+    os.makedirs(directory, exist_ok=True)
+    start = time.time()
+    files = [_export(export, directory, file_format) for export in _exports()]
+    manifest = {
+        "created_at": datetime.now().isoformat(),
+        "format": file_format,
+        "files": files,
+    }
+    with open(os.path.join(directory, MANIFEST_FILE), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    logger.info("Exported %s files to %s in %.1f s", len(files), directory, time.time() - start)
+    return manifest
+
+def open_snapshot(directory: str) -> Tuple[Dict, Dict[str, "pa.Table"]]:
+    # Memory maps every file of an exported snapshot
+    _require_pyarrow()
+    with open(os.path.join(directory, MANIFEST_FILE)) as manifest_file:
+        manifest = json.load(manifest_file)
+    tables = {}
+    for entry in manifest["files"]:
+        path = os.path.join(directory, entry["file"])
+        if manifest["format"] == "parquet":
+            tables[entry["name"]] = pq.read_table(path, memory_map=True)
+        else:
+            tables[entry["name"]] = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return manifest, tables
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export every table to Parquet or Arrow IPC files")
+    parser.add_argument("directory")
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    args = parser.parse_args()
+    export_snapshot(args.directory, args.format)
@@ -0,0 +1,101 @@
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+
+from ReadModels import load_all
+from Games import Generation
+from Pokemon import Pokemon, PokemonSpecies, PokemonType
+
+logger = logging.getLogger('ReadModels.StatStore')
+
+STAT_FIELDS = ("hp", "attack", "defense", "special_attack", "special_defense", "speed", "bst")
+EV_FIELDS = ("hp_ev", "attack_ev", "defense_ev", "special_attack_ev", "special_defense_ev", "speed_ev")
+
+# Ids are poke_api_ids, 0 where a Pokemon has no second type
+STAT_DTYPE = np.dtype(
+    [("pokemon_id", np.int32), ("species_id", np.int32), ("generation_id", np.int16),
+     ("type_1_id", np.int16), ("type_2_id", np.int16), ("is_default", np.bool_), ("fully_evolved", np.bool_)]
+    + [(field, np.int16) for field in STAT_FIELDS]
+    + [(field, np.int8) for field in EV_FIELDS]
+)
+
+# Columnar snapshot of Pokemon base stats and EVs, one structured array row per Pokemon ordered by pokemon_id
+# Filters are boolean masks over rows, combine them with & and | or with comparisons on rows[field]
+class StatStore:
+    def __init__(self, rows: np.ndarray):
+        self.rows = rows
+        self._index: Dict[int, int] = {int(pokemon_id): idx for idx, pokemon_id in enumerate(rows["pokemon_id"])}
+
+    @classmethod
+    def load(cls) -> "StatStore":
+        generation_ids = {row.id: row.poke_api_id for row in load_all(Generation)}
+        type_ids = {row.id: row.poke_api_id for row in load_all(PokemonType)}
+        species = load_all(PokemonSpecies)
+        # A species is fully evolved when no other species evolves from it
+        evolves_from = {row.evolves_from_species_key for row in species}
+        species_map = {row.id: row for row in species}
+
+        pokemon = sorted(load_all(Pokemon), key=lambda row: row.poke_api_id)
+        rows = np.zeros(len(pokemon), dtype=STAT_DTYPE)
+        for idx, row in enumerate(pokemon):
+            species_row = species_map.get(row.species_key)
+            rows[idx] = (
+                row.poke_api_id,
+                species_row.poke_api_id if species_row else 0,
+                generation_ids.get(species_row.generation_key, 0) if species_row else 0,
+                type_ids.get(row.type_1_key, 0),
+                type_ids.get(row.type_2_key, 0),
+                bool(row.is_default),
+                species_row is not None and species_row.id not in evolves_from,
+                *[getattr(row, field) or 0 for field in STAT_FIELDS],
+                *[getattr(row, field) or 0 for field in EV_FIELDS],
+            )
+        logger.debug("Loaded StatStore with %s Pokemon", len(rows))
+        return cls(rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def get(self, pokemon_id: int) -> np.void:
+        return self.rows[self._index[pokemon_id]]
+
+    def mask(self, generation_id: Optional[int] = None, type_id: Optional[int] = None,
+             is_default: Optional[bool] = None, fully_evolved: Optional[bool] = None) -> np.ndarray:
+        mask = np.ones(len(self.rows), dtype=bool)
+        if generation_id is not None:
+            mask &= self.rows["generation_id"] == generation_id
+        if type_id is not None:
+            mask &= (self.rows["type_1_id"] == type_id) | (self.rows["type_2_id"] == type_id)
+        if is_default is not None:
+            mask &= self.rows["is_default"] == is_default
+        if fully_evolved is not None:
+            mask &= self.rows["fully_evolved"] == fully_evolved
+        return mask
+
+    def filter(self, mask: np.ndarray) -> np.ndarray:
+        return self.rows[mask]
+
+    def sort(self, field: str, mask: Optional[np.ndarray] = None, descending: bool = True) -> np.ndarray:
+        rows = self.rows if mask is None else self.rows[mask]
+        order = np.argsort(rows[field], kind="stable")
+        if descending:
+            order = order[::-1]
+        return rows[order]
+
+    def top_k(self, field: str, k: int, mask: Optional[np.ndarray] = None, descending: bool = True) -> np.ndarray:
+        # The first k rows of sort(), without sorting everything
+        # partition finds the k-th value, only the rows up to it (ties included) are sorted
+        rows = self.rows if mask is None else self.rows[mask]
+        if k >= len(rows):
+            return self.sort(field, mask, descending)
+        if k <= 0:
+            return rows[:0]
+        values = rows[field].astype(np.int32)
+        if descending:
+            values = -values
+        kth = np.partition(values, k - 1)[k - 1]
+        candidates = np.flatnonzero(values <= kth)
+        # sort() reverses a stable ascending sort when descending, so ties come in reverse row order then
+        ties = -candidates if descending else candidates
+        return rows[candidates[np.lexsort((ties, values[candidates]))][:k]]
@@ -0,0 +1,159 @@
+import logging
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ReadModels import load_all
+from Games import Generation, VersionGroup
+from Moves import Move, DamageClass
+from Pokemon import PokemonType
+from LearnsetIndex import LearnsetIndex
+from TypeMatrix import TypeMatrix
+
+logger = logging.getLogger('ReadModels.TeamCoverage')
+
+SUPER_EFFECTIVE = 2.0
+
+# Type sets are bitmasks with a bit per TypeMatrix type position
+MASK_DTYPE = np.dtype(np.uint64)
+MASK_BITS = MASK_DTYPE.itemsize * 8
+
+TeamScore = namedtuple("TeamScore", ["pokemon_ids", "score", "covered_type_ids", "shared_weakness_type_ids"])
+
+def _popcount(masks: np.ndarray) -> np.ndarray:
+    # Set bits of every mask
+    masks = np.ascontiguousarray(masks, dtype=MASK_DTYPE)
+    return np.unpackbits(masks.view(np.uint8).reshape(-1, MASK_DTYPE.itemsize), axis=1).sum(axis=1).reshape(masks.shape)
+
+# Offensive and defensive coverage of every Pokemon, positions follow TypeMatrix.pokemon_ids and type_ids
+#   attack_masks[pokemon]: bit per type of a damaging move the Pokemon learns in the version group
+#   coverage_masks[pokemon]: bit per defending type one of those moves hits super effectively
+#   weaknesses[pokemon]: bool per attacking type doing at least double damage to the Pokemon
+# Masks are computed per version group on first use and cached
+class TeamCoverage:
+    def __init__(self, types: TypeMatrix, learnsets: LearnsetIndex, move_type_idx: Dict[int, int], version_group_generations: Dict[int, int]):
+        if len(types.type_ids) > MASK_BITS:
+            raise ValueError(f"{len(types.type_ids)} types do not fit in a {MASK_BITS} bit type mask")
+        self.types = types
+        self.learnsets = learnsets
+        # damaging move poke_api_id -> type position
+        self.move_type_idx = move_type_idx
+        self.version_group_generations = version_group_generations
+        self._masks: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        # Learnset bit position of each TypeMatrix Pokemon, -1 when it learns nothing
+        positions = (learnsets.pokemon_position(int(pokemon_id)) for pokemon_id in types.pokemon_ids)
+        self._learnset_pos = np.array([-1 if pos is None else pos for pos in positions], dtype=np.intp)
+
+    @classmethod
+    def load(cls, types: Optional[TypeMatrix] = None, learnsets: Optional[LearnsetIndex] = None) -> "TeamCoverage":
+        types = types or TypeMatrix.load()
+        learnsets = learnsets or LearnsetIndex.build()
+        type_ids = {row.id: row.poke_api_id for row in load_all(PokemonType)}
+        damaging = {row.id for row in load_all(DamageClass) if row.name != "status"}
+        move_type_idx = {}
+        for row in load_all(Move):
+            type_id = type_ids.get(row.move_type_key)
+            if row.damage_class_key in damaging and row.power and type_id is not None and types.has_type(type_id):
+                move_type_idx[row.poke_api_id] = types.type_index(type_id)
+        generation_ids = {row.id: row.poke_api_id for row in load_all(Generation)}
+        version_group_generations = {row.poke_api_id: generation_ids.get(row.generation_key) for row in load_all(VersionGroup)}
+        return cls(types, learnsets, move_type_idx, version_group_generations)
+
+    def _generation(self, version_group_id: int) -> Optional[int]:
+        return self.version_group_generations.get(version_group_id)
+
+    def masks(self, version_group_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        # (attack_masks, coverage_masks)
+        cached = self._masks.get(version_group_id)
+        if cached is not None:
+            return cached
+        n_types = len(self.types.type_ids)
+        n_learners = len(self.learnsets.pokemon_ids)
+        # learners[type, learnset position] of any damaging move of that type
+        learners = np.zeros((n_types, self.learnsets.pokemon_bits.shape[1]), dtype=np.uint8)
+        for move_id, type_idx in self.move_type_idx.items():
+            learners[type_idx] |= self.learnsets.learner_bits(move_id, version_group_id)
+        learns_type = np.unpackbits(learners, axis=1, count=n_learners).astype(bool) if n_learners else np.zeros((n_types, 0), dtype=bool)
+
+        attack_masks = np.zeros(len(self.types.pokemon_ids), dtype=MASK_DTYPE)
+        known = self._learnset_pos >= 0
+        type_bits = np.left_shift(MASK_DTYPE.type(1), np.arange(n_types, dtype=MASK_DTYPE))
+        attack_masks[known] = np.bitwise_or.reduce(np.where(learns_type[:, self._learnset_pos[known]].T, type_bits, 0), axis=1, initial=0)
+
+        # super_effective[attacking type] = mask of defending types
+        matrix = self.types.multipliers[self.types.generation_index(self._generation(version_group_id))][:, :n_types]
+        super_effective = np.bitwise_or.reduce(np.where(matrix >= SUPER_EFFECTIVE, type_bits, 0), axis=1, initial=0).astype(MASK_DTYPE)
+        has_type = (attack_masks[:, None] & type_bits) != 0
+        coverage_masks = np.bitwise_or.reduce(np.where(has_type, super_effective, 0), axis=1, initial=0).astype(MASK_DTYPE)
+
+        self._masks[version_group_id] = (attack_masks, coverage_masks)
+        logger.debug("Computed coverage masks for version group %s", version_group_id)
+        return attack_masks, coverage_masks
+
+    def weaknesses(self, version_group_id: int) -> np.ndarray:
+        return self.types.defensive_profiles(self._generation(version_group_id)) >= SUPER_EFFECTIVE
+
+    def _type_ids(self, mask: int) -> List[int]:
+        return [int(type_id) for bit, type_id in enumerate(self.types.type_ids) if mask >> bit & 1]
+
+    def _score(self, coverage: np.ndarray, weak_counts: np.ndarray, weakness_weight: float) -> np.ndarray:
+        # Types covered minus every weakness shared by more than one member
+        shared = np.maximum(weak_counts - 1, 0).sum(axis=-1)
+        return _popcount(coverage) - weakness_weight * shared
+
+    def evaluate(self, pokemon_ids: Sequence[int], version_group_id: int, weakness_weight: float = 1.0) -> TeamScore:
+        idx = self.types.pokemon_indexes(pokemon_ids)
+        _, coverage_masks = self.masks(version_group_id)
+        coverage = np.bitwise_or.reduce(coverage_masks[idx], initial=0)
+        weak_counts = self.weaknesses(version_group_id)[idx].sum(axis=0)
+        score = float(self._score(np.array([coverage], dtype=MASK_DTYPE), weak_counts[None, :], weakness_weight)[0])
+        return TeamScore(tuple(pokemon_ids), score, self._type_ids(int(coverage)),
+                         [int(type_id) for type_id in self.types.type_ids[weak_counts > 1]])
+
+    def best_teams(self, version_group_id: int, size: int = 6, n: int = 10, beam_width: int = 256,
+                   candidate_ids: Optional[Sequence[int]] = None, required_ids: Sequence[int] = (),
+                   weakness_weight: float = 1.0) -> List[TeamScore]:
+        # Beam search: every round adds one member to each kept team, and keeps the beam_width best distinct teams
+        _, coverage_masks = self.masks(version_group_id)
+        weak = self.weaknesses(version_group_id).astype(np.int16)
+        if candidate_ids is None:
+            candidates = np.flatnonzero(coverage_masks)
+        else:
+            candidates = self.types.pokemon_indexes(candidate_ids)
+        required = tuple(sorted(self.types.pokemon_index(pokemon_id) for pokemon_id in required_ids))
+        candidates = np.setdiff1d(candidates, required)
+
+        coverage = np.bitwise_or.reduce(coverage_masks[list(required)], initial=0).astype(MASK_DTYPE)
+        beam = [(required, coverage, weak[list(required)].sum(axis=0).astype(np.int16))]
+        for _ in range(len(required), size):
+            teams, coverages, weak_counts = [], [], []
+            for team, team_coverage, team_weak in beam:
+                options = candidates[~np.isin(candidates, team)]
+                if not len(options):
+                    continue
+                teams.extend(team + (idx,) for idx in options.tolist())
+                coverages.append(team_coverage | coverage_masks[options])
+                weak_counts.append(team_weak[None, :] + weak[options])
+            if not teams:
+                break
+            coverages = np.concatenate(coverages)
+            weak_counts = np.concatenate(weak_counts)
+            scores = self._score(coverages, weak_counts, weakness_weight)
+
+            # Best first, the same team reached in a different order only counts once
+            order = np.argsort(-scores, kind="stable")
+            beam = []
+            seen = set()
+            for pos in order.tolist():
+                key = tuple(sorted(teams[pos]))
+                if key in seen:
+                    continue
+                seen.add(key)
+                beam.append((key, coverages[pos], weak_counts[pos]))
+                if len(beam) >= beam_width:
+                    break
+
+        results = [self.evaluate([int(self.types.pokemon_ids[idx]) for idx in team], version_group_id, weakness_weight) for team, _, _ in beam]
+        results.sort(key=lambda result: -result.score)
+        return results[:n]
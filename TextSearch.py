@@ -0,0 +1,251 @@
+import re
+import math
+import bisect
+import logging
+import threading
+import unicodedata
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Union
+
+from sqlalchemy import select
+
+from Base import engine
+from ReadModels import load_all
+from Games import Version, VersionGroup
+from TextEntries import Language, TextEntry
+from IndexRegistry import IndexRegistry
+
+logger = logging.getLogger('ReadModels.TextSearch')
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Limit on the number of terms a prefix expands to
+MAX_PREFIX_TERMS = 100
+
+SearchHit = namedtuple("SearchHit", ["entry_id", "type", "object_key", "score"])
+# Indexed entry, keys are TextEntry column values (database ids)
+IndexedEntry = namedtuple("IndexedEntry", ["type", "language_key", "version_key", "version_group_key", "object_key", "terms"])
+
+_word_re = re.compile(r"\w+")
+
+def _is_cjk(char: str) -> bool:
+    code = ord(char)
+    return (0x3040 <= code <= 0x30FF or 0x3400 <= code <= 0x4DBF or 0x4E00 <= code <= 0x9FFF
+            or 0xAC00 <= code <= 0xD7AF or 0xF900 <= code <= 0xFAFF or 0xFF66 <= code <= 0xFF9F)
+
+def normalize(text: str) -> str:
+    # Case folded with accents removed, so "Pokémon" matches "pokemon"
+    # NFKC afterwards recomposes Hangul syllables, which NFKD splits into jamo
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return unicodedata.normalize("NFKC", stripped)
+
+def tokenize(text: str) -> List[str]:
+    # Words for space separated scripts, single characters for CJK text which has no word breaks
+    tokens = []
+    for word in _word_re.findall(normalize(text)):
+        if any(_is_cjk(char) for char in word):
+            run = ""
+            for char in word:
+                if _is_cjk(char):
+                    if run:
+                        tokens.append(run)
+                        run = ""
+                    tokens.append(char)
+                else:
+                    run += char
+            if run:
+                tokens.append(run)
+        else:
+            tokens.append(word)
+    return tokens
+
+class LanguageIndex:
+    def __init__(self):
+        # term -> {entry id: positions}
+        self.postings: Dict[str, Dict[int, List[int]]] = {}
+        self.terms: List[str] = []
+        self.total_length = 0
+        self.count = 0
+
+    def add(self, entry_id: int, tokens: List[str]) -> None:
+        positions: Dict[str, List[int]] = {}
+        for position, token in enumerate(tokens):
+            positions.setdefault(token, []).append(position)
+        for term, term_positions in positions.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                bisect.insort(self.terms, term)
+            postings[entry_id] = term_positions
+        self.total_length += len(tokens)
+        self.count += 1
+
+    def remove(self, entry_id: int, tokens: List[str]) -> None:
+        for term in set(tokens):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(entry_id, None)
+            if not postings:
+                del self.postings[term]
+                del self.terms[bisect.bisect_left(self.terms, term)]
+        self.total_length -= len(tokens)
+        self.count -= 1
+
+    def expand_prefix(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + "\U0010FFFF")
+        return self.terms[start:min(end, start + MAX_PREFIX_TERMS)]
+
+# Inverted index over TextEntry.text_entry, one per language, with positional postings
+# Built once with build(), then kept current through entries_changed() which the crawler calls
+class TextSearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._languages: Dict[int, LanguageIndex] = {}
+        self._entries: Dict[int, IndexedEntry] = {}
+        # Database ids by poke_api_id (and by name for languages), so search() resolves its filters without the ORM cache
+        self._language_keys: Dict[Union[int, str], int] = {}
+        self._version_keys: Dict[int, int] = {}
+        self._version_group_keys: Dict[int, int] = {}
+
+    @staticmethod
+    def _load_keys() -> tuple:
+        languages = load_all(Language)
+        language_keys: Dict[Union[int, str], int] = {row.poke_api_id: row.id for row in languages}
+        language_keys.update((row.name, row.id) for row in languages if row.name)
+        return (language_keys,
+                {row.poke_api_id: row.id for row in load_all(Version)},
+                {row.poke_api_id: row.id for row in load_all(VersionGroup)})
+
+    def _has_keys(self, entry: TextEntry) -> bool:
+        version_key = getattr(entry, "version_key", None)
+        version_group_key = getattr(entry, "version_group_key", None)
+        return (entry.language_key in self._language_keys.values()
+                and (version_key is None or version_key in self._version_keys.values())
+                and (version_group_key is None or version_group_key in self._version_group_keys.values()))
+
+    @classmethod
+    def build(cls) -> "TextSearchIndex":
+        index = cls()
+        index._language_keys, index._version_keys, index._version_group_keys = cls._load_keys()
+        table = TextEntry.__table__
+        stmt = select(table.c.id, table.c.type, table.c.language_key, table.c.version_key, table.c.version_group_key,
+                      table.c.object_key, table.c.text_entry)
+        with engine.connect() as conn:
+            for row in conn.execution_options(stream_results=True, yield_per=5000).execute(stmt):
+                index._add(row.id, row.type, row.language_key, row.version_key, row.version_group_key, row.object_key, row.text_entry)
+        logger.debug("Built TextSearchIndex: %s entries in %s languages", len(index._entries), len(index._languages))
+        register(index)
+        return index
+
+    def _add(self, entry_id: int, type_: str, language_key: int, version_key: Optional[int],
+             version_group_key: Optional[int], object_key: Optional[int], text: Optional[str]) -> None:
+        if entry_id in self._entries:
+            self._remove(entry_id)
+        tokens = tokenize(text or "")
+        self._languages.setdefault(language_key, LanguageIndex()).add(entry_id, tokens)
+        self._entries[entry_id] = IndexedEntry(type_, language_key, version_key, version_group_key, object_key, tokens)
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is not None:
+            self._languages[entry.language_key].remove(entry_id, entry.terms)
+
+    def add_entries(self, entries: Iterable[TextEntry]) -> None:
+        entries = list(entries)
+        # Entries in a language or version ingested after build() reload the id maps, before taking the lock
+        keys = None
+        if not all(self._has_keys(entry) for entry in entries):
+            keys = self._load_keys()
+        with self._lock:
+            if keys is not None:
+                self._language_keys, self._version_keys, self._version_group_keys = keys
+            for entry in entries:
+                self._add(entry.id, entry.type, entry.language_key, getattr(entry, "version_key", None),
+                          getattr(entry, "version_group_key", None), getattr(entry, "object_key", None), entry.text_entry)
+
+    def remove_entries(self, entry_ids: Iterable[int]) -> None:
+        with self._lock:
+            for entry_id in entry_ids:
+                self._remove(entry_id)
+
+    def search(self, language: Union[int, str], query: str, types: Optional[Sequence[str]] = None,
+               version_id: Optional[int] = None, version_group_id: Optional[int] = None,
+               phrase: bool = False, prefix: bool = False, limit: int = 20) -> List[SearchHit]:
+        # Ids are poke_api_ids, language is a poke_api_id or a name like "en", prefix expands the last query term
+        types = set(types) if types else None
+
+        with self._lock:
+            language_key = self._language_keys.get(language)
+            version_key = self._version_keys.get(version_id)
+            version_group_key = self._version_group_keys.get(version_group_id)
+            if language_key is None or (version_id is not None and version_key is None) or (version_group_id is not None and version_group_key is None):
+                return []
+            index = self._languages.get(language_key)
+            tokens = tokenize(query)
+            if index is None or not tokens:
+                return []
+            # Each query position matches any of its alternatives, only the last one has more than one with prefix
+            alternatives: List[List[str]] = [[token] for token in tokens]
+            if prefix:
+                alternatives[-1] = index.expand_prefix(tokens[-1])
+            postings = [self._merged_postings(index, terms) for terms in alternatives]
+            if any(not term_postings for term_postings in postings):
+                return []
+
+            # Candidates contain every query term
+            candidates = set.intersection(*(set(term_postings) for term_postings in postings))
+            avg_length = index.total_length / index.count if index.count else 0.0
+            hits = []
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if types is not None and entry.type not in types:
+                    continue
+                if version_key is not None and entry.version_key != version_key:
+                    continue
+                if version_group_key is not None and entry.version_group_key != version_group_key:
+                    continue
+                if phrase and not _has_phrase([term_postings[entry_id] for term_postings in postings]):
+                    continue
+                score = 0.0
+                for terms, term_postings in zip(alternatives, postings):
+                    doc_freq = len(term_postings)
+                    idf = math.log(1 + (index.count - doc_freq + 0.5) / (doc_freq + 0.5))
+                    freq = len(term_postings[entry_id])
+                    score += idf * freq * (K1 + 1) / (freq + K1 * (1 - B + B * len(entry.terms) / avg_length))
+                hits.append(SearchHit(entry_id, entry.type, entry.object_key, score))
+
+        hits.sort(key=lambda hit: (-hit.score, hit.entry_id))
+        return hits[:limit]
+
+    @staticmethod
+    def _merged_postings(index: LanguageIndex, terms: List[str]) -> Dict[int, List[int]]:
+        if len(terms) == 1:
+            return index.postings.get(terms[0], {})
+        merged: Dict[int, List[int]] = {}
+        for term in terms:
+            for entry_id, positions in index.postings.get(term, {}).items():
+                merged.setdefault(entry_id, []).extend(positions)
+        return merged
+
+def _has_phrase(positions: List[List[int]]) -> bool:
+    # True when some start position has term i at start + i for every term
+    starts: Set[int] = set(positions[0])
+    for offset, term_positions in enumerate(positions[1:], 1):
+        starts &= {position - offset for position in term_positions}
+        if not starts:
+            return False
+    return True
+
+# Indexes kept current by the crawler
+_indexes = IndexRegistry()
+register = _indexes.register
+unregister = _indexes.unregister
+
+def entries_changed(added: Sequence[TextEntry], deleted_ids: Sequence[int]) -> None:
+    for index in _indexes:
+        index.remove_entries(deleted_ids)
+        index.add_entries(added)
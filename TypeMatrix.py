@@ -0,0 +1,172 @@
+import logging
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from ReadModels import load_all
+from Games import Generation
+from Pokemon import Pokemon, PokemonType, PokemonTypeRelation, PastTypeLink
+
+logger = logging.getLogger('ReadModels.TypeMatrix')
+
+def _past_owners(rows: List[tuple]) -> List[int]:
+    # Types whose past_damage_relations produced the rows of one generation.
+    # Every row involves its owner, so pick the type covering the most uncovered rows until all are covered;
+    # a partner type (e.g. Water in Steel's set) only shows up in the rows shared with an owner.
+    owners = []
+    remaining = rows
+    while remaining:
+        counts: Dict[int, int] = {}
+        for off_idx, def_idx, _ in remaining:
+            for type_idx in {off_idx, def_idx}:
+                counts[type_idx] = counts.get(type_idx, 0) + 1
+        owner = min(counts, key=lambda type_idx: (-counts[type_idx], type_idx))
+        owners.append(owner)
+        remaining = [row for row in remaining if owner not in (row[0], row[1])]
+    return owners
+
+def _compile_multipliers(n_gen: int, current: np.ndarray, past: Dict[int, List[tuple]]) -> np.ndarray:
+    # A type's past_damage_relations are its complete relations as of that generation,
+    # so every pair involving the owning type falls back to 1.0 unless listed in the applicable past set.
+    # Later past sets are applied first so the closest generation wins.
+    n_types = current.shape[0]
+    owners = {past_gen: _past_owners(rows) for past_gen, rows in past.items()}
+    multipliers = np.empty((n_gen, n_types, n_types + 1), dtype=np.float32)
+    for gen in range(n_gen):
+        matrix = current.copy()
+        for past_gen in sorted((past_gen for past_gen in past if past_gen >= gen), reverse=True):
+            matrix[owners[past_gen], :] = 1.0
+            matrix[:, owners[past_gen]] = 1.0
+            rows = np.array(past[past_gen], dtype=np.float32)
+            matrix[rows[:, 0].astype(np.intp), rows[:, 1].astype(np.intp)] = rows[:, 2]
+        matrix[:, n_types] = 1.0
+        multipliers[gen] = matrix
+    return multipliers
+
+# Dense type effectiveness tensor compiled from PokemonTypeRelation
+# multipliers[generation, attacking type, defending type] with unlisted pairs at 1.0
+# The extra last defending column is "no type", always 1.0, so single typed Pokemon can use the same product as dual typed ones
+# Public methods take and return poke_api_ids, array positions follow type_ids/generation_ids/pokemon_ids
+class TypeMatrix:
+    def __init__(self, type_ids: np.ndarray, generation_ids: np.ndarray, multipliers: np.ndarray,
+                 pokemon_ids: np.ndarray, pokemon_types: np.ndarray):
+        self.type_ids = type_ids
+        self.generation_ids = generation_ids
+        self.multipliers = multipliers
+        self.pokemon_ids = pokemon_ids
+        # pokemon_types[generation, pokemon] = (type_1 index, type_2 index or NONE)
+        self.pokemon_types = pokemon_types
+
+        self.none_idx = len(type_ids)
+        self._type_idx: Dict[int, int] = {int(type_id): idx for idx, type_id in enumerate(type_ids)}
+        self._generation_idx: Dict[int, int] = {int(generation_id): idx for idx, generation_id in enumerate(generation_ids)}
+        self._pokemon_idx: Dict[int, int] = {int(pokemon_id): idx for idx, pokemon_id in enumerate(pokemon_ids)}
+        self._profiles: Optional[np.ndarray] = None
+
+    @classmethod
+    def load(cls) -> "TypeMatrix":
+        generations = sorted(load_all(Generation), key=lambda row: row.poke_api_id)
+        types = sorted(load_all(PokemonType), key=lambda row: row.poke_api_id)
+        pokemon = sorted(load_all(Pokemon), key=lambda row: row.poke_api_id)
+
+        generation_idx = {row.id: idx for idx, row in enumerate(generations)}
+        type_idx = {row.id: idx for idx, row in enumerate(types)}
+        n_gen = len(generations)
+        n_types = len(types)
+        none_idx = n_types
+
+        # Current relations have no generation, past relations applied up to and including their generation
+        current = np.ones((n_types, n_types + 1), dtype=np.float32)
+        past: Dict[int, List[tuple]] = {}
+        for relation in load_all(PokemonTypeRelation):
+            off_idx = type_idx.get(relation.offensive_type_key)
+            def_idx = type_idx.get(relation.defensive_type_key)
+            if off_idx is None or def_idx is None:
+                continue
+            if relation.generation_key is None:
+                current[off_idx, def_idx] = relation.damage_multiplier
+            elif relation.generation_key in generation_idx:
+                past.setdefault(generation_idx[relation.generation_key], []).append((off_idx, def_idx, relation.damage_multiplier))
+
+        multipliers = _compile_multipliers(n_gen, current, past)
+
+        # Pokemon typing per generation, a PastTypeLink applies up to and including its last generation
+        pokemon_idx = {row.id: idx for idx, row in enumerate(pokemon)}
+        pokemon_types = np.full((n_gen, len(pokemon), 2), none_idx, dtype=np.int16)
+        for idx, row in enumerate(pokemon):
+            pokemon_types[:, idx, 0] = type_idx.get(row.type_1_key, none_idx)
+            pokemon_types[:, idx, 1] = type_idx.get(row.type_2_key, none_idx)
+
+        links = sorted(load_all(PastTypeLink), key=lambda link: generation_idx.get(link.last_generation_key, -1), reverse=True)
+        for link in links:
+            idx = pokemon_idx.get(link.pokemon_key)
+            last_gen = generation_idx.get(link.last_generation_key)
+            if idx is None or last_gen is None:
+                continue
+            pokemon_types[:last_gen + 1, idx, 0] = type_idx.get(link.type_1_key, none_idx)
+            pokemon_types[:last_gen + 1, idx, 1] = type_idx.get(link.type_2_key, none_idx)
+
+        logger.debug("Compiled TypeMatrix: %s generations, %s types, %s pokemon", n_gen, n_types, len(pokemon))
+        return cls(np.array([row.poke_api_id for row in types], dtype=np.int32),
+                   np.array([row.poke_api_id for row in generations], dtype=np.int32),
+                   multipliers,
+                   np.array([row.poke_api_id for row in pokemon], dtype=np.int32),
+                   pokemon_types)
+
+    # Positions in the arrays, for read models built on top of the matrix
+    def generation_index(self, generation_id: Optional[int]) -> int:
+        # Latest generation when not given
+        if generation_id is None:
+            return len(self.generation_ids) - 1
+        return self._generation_idx[generation_id]
+
+    def has_type(self, type_id: int) -> bool:
+        return type_id in self._type_idx
+
+    def type_index(self, type_id: Optional[int]) -> int:
+        # none_idx when not given
+        if type_id is None:
+            return self.none_idx
+        return self._type_idx[type_id]
+
+    def pokemon_index(self, pokemon_id: int) -> int:
+        return self._pokemon_idx[pokemon_id]
+
+    def pokemon_indexes(self, pokemon_ids: Sequence[int]) -> np.ndarray:
+        return np.fromiter((self._pokemon_idx[pokemon_id] for pokemon_id in pokemon_ids), dtype=np.intp, count=len(pokemon_ids))
+
+    def multiplier(self, attacking_type_id: int, defending_type_1_id: int, defending_type_2_id: Optional[int] = None,
+                   generation_id: Optional[int] = None) -> float:
+        matrix = self.multipliers[self.generation_index(generation_id)]
+        att_idx = self._type_idx[attacking_type_id]
+        return float(matrix[att_idx, self.type_index(defending_type_1_id)] * matrix[att_idx, self.type_index(defending_type_2_id)])
+
+    def all_defensive_profiles(self) -> np.ndarray:
+        # [generation, pokemon, attacking type] multiplier taken by every Pokemon in every generation
+        if self._profiles is None:
+            n_gen, n_pokemon, _ = self.pokemon_types.shape
+            gen = np.arange(n_gen)[:, None, None]
+            att = np.arange(len(self.type_ids))[None, None, :]
+            type_1 = self.pokemon_types[:, :, 0][:, :, None]
+            type_2 = self.pokemon_types[:, :, 1][:, :, None]
+            self._profiles = self.multipliers[gen, att, type_1] * self.multipliers[gen, att, type_2]
+        return self._profiles
+
+    def defensive_profiles(self, generation_id: Optional[int] = None) -> np.ndarray:
+        # [pokemon, attacking type] for one generation, rows follow pokemon_ids
+        return self.all_defensive_profiles()[self.generation_index(generation_id)]
+
+    def defensive_profile(self, pokemon_id: int, generation_id: Optional[int] = None) -> Dict[int, float]:
+        profile = self.defensive_profiles(generation_id)[self._pokemon_idx[pokemon_id]]
+        return {int(type_id): float(value) for type_id, value in zip(self.type_ids, profile)}
+
+    def effectiveness(self, attacking_type_ids: Sequence[int], pokemon_ids: Sequence[int], generation_id: Optional[int] = None) -> np.ndarray:
+        # [attacking type, pokemon] multipliers for any combination of attacking types and Pokemon
+        att = np.fromiter((self._type_idx[type_id] for type_id in attacking_type_ids), dtype=np.intp)
+        mon = self.pokemon_indexes(pokemon_ids)
+        return self.defensive_profiles(generation_id)[np.ix_(mon, att)].T
+
+    def pokemon_weak_to(self, attacking_type_id: int, generation_id: Optional[int] = None, threshold: float = 2.0) -> np.ndarray:
+        # poke_api_ids of every Pokemon taking at least threshold times damage from the type
+        column = self.defensive_profiles(generation_id)[:, self._type_idx[attacking_type_id]]
+        return self.pokemon_ids[column >= threshold]